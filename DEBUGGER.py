@@ -1,13 +1,86 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import asyncio
-from pyppeteer import connect
+import collections
+import logging
+import logging.handlers
+import os
+import botlog
+import connection
+import engine
 import game_api
+import lean_mode
+import recorder
+import state_store
+
+BROWSER_URL = "http://127.0.0.1:9222"
+GAME_URL_FRAGMENTS = ["monsoonsim.com"]
+
+
+# --- Log Pane ---
+class LogPane:
+    """
+    The GUI's log: messages are queued (from coroutines or Tk callbacks) and flushed to the widget in batches
+    on a timer. Only the newest max_lines lines are kept, so memory and redraw cost stay flat over a whole game.
+    Optionally mirrors every message to a rotating log file.
+    """
+    COLORS = {"red": "red", "green": "green", "blue": "blue", "orange": "#E69138", "purple": "#800080"}
+
+    def __init__(self, master, max_lines=2000, flush_ms=100, log_file=None):
+        self.master = master
+        self.max_lines = max_lines
+        self.flush_ms = flush_ms
+        self.pending = collections.deque(maxlen=max_lines)  # Anything older would be trimmed straight away
+        self.line_count = 0
+
+        self.widget = scrolledtext.ScrolledText(master, wrap=tk.WORD, height=10)
+        self.widget.pack(fill="both", expand=True)
+        for tag, color in self.COLORS.items():
+            self.widget.tag_config(tag, foreground=color)
+        self.widget.config(state="disabled")
+
+        self.file_logger = None
+        if log_file:
+            handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_logger = logging.getLogger("monsoonsim.gui")
+            self.file_logger.setLevel(logging.INFO)
+            self.file_logger.propagate = False
+            self.file_logger.addHandler(handler)
+
+        self.widget.after(self.flush_ms, self.flush)
+
+    def write(self, msg, color="black"):
+        """Queues a message; it shows up on the next flush."""
+        self.pending.append((msg, color))
+
+    def flush(self):
+        """Inserts all queued messages with one widget update, then trims the oldest lines."""
+        if self.pending:
+            batch = list(self.pending)
+            self.pending.clear()
+            insert_args = []
+            for msg, color in batch:
+                insert_args += [f"{msg}\n", color]
+                self.line_count += msg.count("\n") + 1
+                if self.file_logger:
+                    self.file_logger.info(msg)
+
+            self.widget.config(state="normal")
+            self.widget.insert(tk.END, *insert_args)
+            excess = self.line_count - self.max_lines
+            if excess > 0:
+                self.widget.delete("1.0", f"{excess + 1}.0")
+                self.line_count -= excess
+            self.widget.see(tk.END)
+            self.widget.config(state="disabled")
+        self.widget.after(self.flush_ms, self.flush)
 
 
 # --- Main Application Class ---
 class App(tk.Tk):
-    def __init__(self, loop):
+    def __init__(self, loop, log_file=None, record_file=None, state_file=state_store.DEFAULT_PATH):
         super().__init__()
         self.loop = loop
         self.title("MonsoonSim AI Controller")
@@ -16,10 +89,18 @@ class App(tk.Tk):
 
         # --- Internal State ---
         self.browser = None
+        self.link = None  # connection.BrowserLink; reconnects by itself if the DevTools connection drops
+        self.target_id = None
         self.page = None
         self.retail_task = None
         self.service_task = None
         self.full_task = None
+        self.recorder = recorder.Recorder(record_file) if record_file else None
+        # What is learned about each game survives restarts (see state_store.py)
+        self.state_store = state_store.StateStore(state_file)
+        self.game_url = None
+        self.last_day_done = None  # Last day a loop completed in this game; a loop (re)started on it waits for the next
+        self.restoring = False
 
         # Internal list to hold dynamic calc labels
         self.calc_labels = []
@@ -47,6 +128,8 @@ class App(tk.Tk):
         self.connect_button.pack(side="left", padx=5)
         self.status_label = ttk.Label(connection_frame, text="Status: Disconnected", foreground="red")
         self.status_label.pack(side="left", padx=5)
+        self.lean_mode_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(connection_frame, text="Lean mode", variable=self.lean_mode_var).pack(side="left", padx=5)
 
         global_settings_frame = ttk.LabelFrame(top_frame, text="Global Settings", padding=10)
         global_settings_frame.pack(side="left", fill="x", padx=(5, 0))
@@ -90,9 +173,7 @@ class App(tk.Tk):
         self.setup_automation_tab(automation_tab)
 
         # --- Log Frame ---
-        self.log_area = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=10)
-        self.log_area.pack(fill="both", expand=True)
-        self.log_area.config(state="disabled")
+        self.log_pane = LogPane(log_frame, log_file=log_file)
 
         # --- Initialize dynamic labels ---
         self.update_dynamic_labels()
@@ -116,10 +197,15 @@ class App(tk.Tk):
 
         ttk.Label(manual_frame, text="Target Fill Level:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
         self.fill_percentage_var = tk.IntVar(value=100)
+        self.fill_percentage_var.trace_add(
+            "write", lambda *args: self.save_game_state(fill_percentage=self.fill_percentage_var.get()))
         fill_percentage_dropdown = ttk.Combobox(manual_frame, textvariable=self.fill_percentage_var,
                                                 values=[100, 120, 140, 150, 160], state='readonly', width=5)
         fill_percentage_dropdown.grid(row=1, column=1, sticky="w", padx=5, pady=5)
         ttk.Label(manual_frame, text="%").grid(row=1, column=1, sticky="e")
+        self.direct_orders_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(manual_frame, text="Direct orders", variable=self.direct_orders_var).grid(
+            row=1, column=2, sticky="w", padx=5)
 
         priority_frame = ttk.LabelFrame(manual_frame, text="Prioritize Products", padding=10)
         priority_frame.grid(row=2, column=0, columnspan=3, sticky="ew", padx=5, pady=10)
@@ -216,6 +302,7 @@ class App(tk.Tk):
             label.config(text="Status: RUNNING", foreground="green")
             new_task = self.loop.create_task(self.run_automation_loop(mode))
             setattr(self, task_attr, new_task)
+            self.save_game_state(running=mode)
 
     async def run_automation_loop(self, mode):
         if mode == 'retail':
@@ -231,41 +318,23 @@ class App(tk.Tk):
             return
 
         try:
-            while True:
-                current_day_info = await game_api.get_current_day(self.page)
-                current_day = current_day_info['current']
-                self.log_message(f"--- Starting Day {current_day} ---", "purple")
-
-                if mode in ['service', 'full']:
-                    service_result = await game_api.handle_service_requests(self.page)
-                    self.log_message(f"Service Check: {service_result}", "blue")
-
-                if mode in ['retail', 'full']:
-                    locations = self.location_dropdown['values']
-                    if not locations:
-                        self.log_message(f"AUTO-STOP ({mode}): No locations fetched.", "red")
+            with recorder.use_recorder(self.recorder, self.page.url):
+                while True:
+                    try:
+                        await engine.run_automation_loop(self.page, mode, self.get_automation_settings,
+                                                         self.log_message, resume_after_day=self.last_day_done,
+                                                         on_day_done=self.save_day_done)
+                        self.save_game_state(running=None)  # Game over
                         break
-
-                    target_percentage = self.fill_percentage_var.get()
-
-                    # --- MODIFICATION: Load preset for each location in loop ---
-                    for location in locations:
-                        # Load the preset for this location
-                        prioritized_products = self.priority_presets.get(location, [])
-                        self.log_message(f"Using preset for {location}: {prioritized_products or 'None'}", "blue")
-
-                        replenish_result = await game_api.procure_for_retail_location(self.page, location,
-                                                                                      prioritized_products,
-                                                                                      target_percentage)
-                        self.log_message(f"Replenish ({location}): {replenish_result}")
-
-                day_info = await game_api.wait_for_next_day(self.page, current_day)
-                if day_info['current'] >= day_info['total']:
-                    self.log_message("GAME OVER", "green")
-                    break
+                    except Exception as e:
+                        if self.link.connected and not self.page.isClosed():
+                            raise
+                        self.log_message(f"Connection to the game tab lost ({e}). Re-attaching...", "orange")
+                        await self.reattach()
 
         except asyncio.CancelledError:
             self.log_message(f"Automation loop ({mode}) stopped by user.", "orange")
+            self.save_game_state(running=None)
         except Exception as e:
             self.log_message(f"AUTOMATION ERROR ({mode}): {e}", "red")
         finally:
@@ -280,6 +349,29 @@ class App(tk.Tk):
             elif mode == 'full':
                 self.full_task = None
 
+    async def reattach(self):
+        """Finds the game tab again once the browser connection is back, keeping what was learned about it."""
+        self.status_label.config(text="Status: Reconnecting", foreground="orange")
+        target_id, page = await self.link.resolve(self.target_id, GAME_URL_FRAGMENTS, timeout=120)
+        game_api.adopt_page_state(self.page, page)
+        self.page, self.target_id, self.browser = page, target_id, self.link.browser
+        await game_api.install_helpers(self.page)
+        if self.lean_mode_var.get():
+            await lean_mode.enable(self.page)
+        self.status_label.config(text="Status: Connected", foreground="green")
+        self.log_message(f"Re-attached to: {self.page.url}", "green")
+
+    def save_day_done(self, day):
+        self.last_day_done = day
+        self.save_game_state(last_day=day)
+
+    def get_automation_settings(self):
+        """Reads the loop settings from the GUI; called by the engine at the start of every day."""
+        return engine.make_settings(locations=self.location_dropdown['values'],
+                                    presets=self.priority_presets,
+                                    fill_percentage=self.fill_percentage_var.get(),
+                                    direct_orders=self.direct_orders_var.get())
+
     def update_dynamic_labels(self):
         """Updates all product-sensitive labels in the GUI."""
         try:
@@ -306,8 +398,55 @@ class App(tk.Tk):
 
         # Save to the dictionary
         self.priority_presets[location] = current_priorities
+        self.save_presets()
         self.log_message(f"Preset saved for {location}: {current_priorities or 'None'}", "blue")
 
+    # --- Saved game state ---
+    def save_game_state(self, **fields):
+        """Saves fields of the connected game's state to disk (not while that state is being restored)."""
+        if self.game_url and not self.restoring:
+            self.state_store.update(self.game_url, **fields)
+
+    def saved_presets(self):
+        """The saved presets of the connected game, by location set."""
+        return self.state_store.get(self.game_url).get("presets", {}) if self.game_url else {}
+
+    def save_presets(self):
+        self.save_game_state(presets={**self.saved_presets(), self.location_set_var.get(): self.priority_presets})
+
+    async def restore_game_state(self):
+        """
+        Restores what was saved for the connected game: product and location sets, fill %, presets and locations.
+        The saved locations are checked with one read of the KPI panel. If a loop was running when the bot stopped,
+        it is started again and picks up on the next day change.
+        """
+        self.game_url = self.page.url
+        saved = self.state_store.get(self.game_url)
+        if not saved:
+            await self.fetch_and_update_locations()
+            return
+        self.log_message(f"Restoring the saved state of this game (last day done: {saved.get('last_day')}).", "blue")
+        self.restoring = True
+        try:
+            if saved.get("product_set") and saved["product_set"] != self.product_set_var.get():
+                self.product_set_var.set(saved["product_set"])
+                self.handle_product_set_change()
+            if saved.get("location_set") and saved["location_set"] != self.location_set_var.get():
+                self.location_set_var.set(saved["location_set"])
+                self.handle_location_set_change()
+            if saved.get("fill_percentage"):
+                self.fill_percentage_var.set(saved["fill_percentage"])
+            self.priority_presets = saved.get("presets", {}).get(self.location_set_var.get(), {})
+            self.last_day_done = saved.get("last_day")
+        finally:
+            self.restoring = False
+        await self.fetch_and_update_locations()
+        if saved.get("locations") and list(self.location_dropdown['values']) != saved["locations"]:
+            self.log_message(f"Owned locations changed since the last run: {saved['locations']}", "orange")
+        if saved.get("running") in engine.MODES and self.location_dropdown['values']:
+            self.log_message(f"Resuming the {saved['running']} loop that was running when the bot stopped.", "blue")
+            self.toggle_automation(saved["running"])
+
     # --- NEW: Load the preset when a location is selected ---
     def load_selected_preset(self, event=None):
         location = self.location_var.get()
@@ -332,9 +471,11 @@ class App(tk.Tk):
             self.log_message(f"Location map switched to {selected_set}.", "blue")
             self.location_dropdown['values'] = []
             self.location_var.set("")
-            # --- NEW: Clear presets when changing maps ---
-            self.priority_presets = {}
-            self.log_message("Priority presets cleared for new map.", "orange")
+            # Presets are kept per map: switch to the ones saved for the new map (if any)
+            self.priority_presets = self.saved_presets().get(selected_set, {})
+            self.save_game_state(location_set=selected_set)
+            self.log_message(f"Priority presets switched to the {selected_set} map "
+                             f"({len(self.priority_presets)} saved).", "orange")
         except Exception as e:
             self.log_message(f"Error changing location set: {e}", "red")
 
@@ -363,6 +504,8 @@ class App(tk.Tk):
                     new_priority_vars[new_name] = var_obj
             self.priority_vars = new_priority_vars
 
+            self.save_game_state(product_set=selected_set)
+            self.save_presets()
             self.update_dynamic_labels()
             self.load_selected_preset()  # Reload presets for current location
             self.log_message(f"GUI updated to {selected_set} set.", "blue")
@@ -379,7 +522,7 @@ class App(tk.Tk):
         prioritized = [name for name, var in self.priority_vars.items() if var.get()]
         target_perc = self.fill_percentage_var.get()
         task = game_api.procure_for_retail_location(self.page, location, prioritized,
-                                                    target_fill_percentage=target_perc)
+                                                    target_fill_percentage=target_perc, force=True)
         self.schedule_task(task)
 
     def handle_calculate_replenish(self):
@@ -426,6 +569,7 @@ class App(tk.Tk):
         try:
             locations = await game_api.get_owned_retail_locations(self.page)
             self.location_dropdown['values'] = locations
+            self.save_game_state(locations=list(locations))
             if locations:
                 # --- MODIFICATION: Set location and auto-load its preset ---
                 self.location_var.set(locations[0])
@@ -456,18 +600,22 @@ class App(tk.Tk):
 
     async def connect_to_browser(self):
         try:
-            self.browser = await connect(browserURL="http://127.0.0.1:9222", defaultViewport=None)
-            pages = await self.browser.pages()
-            target_page = None
-            for p in pages:
-                if "monsoonsim.com" in p.url:
-                    target_page = p
-                    break
-            if target_page:
-                self.page = target_page
+            if self.link is None:
+                link = connection.BrowserLink(BROWSER_URL)
+                await link.open()
+                self.link = link  # Only once connected, so a failed attempt can be retried with the button
+            # Only the game tab is attached to, not every open tab
+            targets = await connection.list_targets(BROWSER_URL, GAME_URL_FRAGMENTS)
+            if targets:
+                self.target_id = targets[0]["id"]
+                self.page = await connection.attach(self.link.browser, self.target_id)
+                self.browser = self.link.browser
+                await game_api.install_helpers(self.page)
+                if self.lean_mode_var.get():
+                    await lean_mode.enable(self.page)
                 self.status_label.config(text="Status: Connected", foreground="green")
                 self.log_message(f"Connected to: {self.page.url}", "green")
-                self.schedule_fetch_locations()
+                self.schedule_task(self.restore_game_state())
             else:
                 raise Exception("MonsoonSIM page not found.")
         except Exception as e:
@@ -476,16 +624,7 @@ class App(tk.Tk):
         self.connect_button.config(state="normal")
 
     def log_message(self, msg, color="black"):
-        self.log_area.config(state="normal")
-        self.log_area.insert(tk.END, f"{msg}\n")
-        self.log_area.tag_config("red", foreground="red")
-        self.log_area.tag_config("green", foreground="green")
-        self.log_area.tag_config("blue", foreground="blue")
-        self.log_area.tag_config("orange", foreground="#E69138")
-        self.log_area.tag_config("purple", foreground="#800080")
-        self.log_area.tag_add(color, "end-1c linestart", "end-1c lineend")
-        self.log_area.see(tk.END)
-        self.log_area.config(state="disabled")
+        self.log_pane.write(msg, color)
 
 
 async def main_loop(app):
@@ -498,8 +637,15 @@ async def main_loop(app):
 
 
 if __name__ == "__main__":
+    # The console gets game_api's log. MONSOONSIM_LOG_LEVEL=DEBUG shows every step; MONSOONSIM_LOG_JSON=1 logs JSON
+    botlog.configure(os.environ.get("MONSOONSIM_LOG_LEVEL", "INFO"), bool(os.environ.get("MONSOONSIM_LOG_JSON")))
     main_event_loop = asyncio.get_event_loop()
-    app = App(main_event_loop)
+    # Set MONSOONSIM_LOG_FILE to also keep a rotating on-disk log of the session,
+    # and MONSOONSIM_RECORD_FILE to record the automation loops for replay.py.
+    # Per-game state is kept in MONSOONSIM_STATE_FILE (default: monsoonsim_state.json in the working directory)
+    app = App(main_event_loop, log_file=os.environ.get("MONSOONSIM_LOG_FILE"),
+              record_file=os.environ.get("MONSOONSIM_RECORD_FILE"),
+              state_file=os.environ.get("MONSOONSIM_STATE_FILE", state_store.DEFAULT_PATH))
 
 
     def on_closing():
@@ -512,3 +658,7 @@ if __name__ == "__main__":
 
     app.protocol("WM_DELETE_WINDOW", on_closing)
     main_event_loop.run_until_complete(main_loop(app))
+    if app.page:
+        main_event_loop.run_until_complete(lean_mode.disable(app.page))
+    if app.recorder:
+        app.recorder.close()
@@ -0,0 +1,135 @@
+# bench_day_pass.py
+# End-to-end benchmark: drives headless Chrome through the automation engine's daily pass,
+# against the local fake game, and reports wall time, CDP round-trips and rate-limit hits per day.
+#   python benchmarks/bench_day_pass.py --mode full --bench-days 5 --day-length 15
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from pyppeteer import launch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import botlog  # noqa: E402
+import engine  # noqa: E402
+import game_api  # noqa: E402
+import kpi_mirror  # noqa: E402
+import lean_mode  # noqa: E402
+import tracing  # noqa: E402
+import fake_game  # noqa: E402
+
+
+class RoundTripCounter:
+    """Counts the CDP messages a page sends by wrapping its session's send()."""
+
+    def __init__(self, page):
+        self.count = 0
+        client = page._client
+        original_send = client.send
+
+        def counting_send(method, params=None):
+            self.count += 1
+            return original_send(method, params)
+
+        client.send = counting_send
+
+
+async def run_day_pass(page, mode, locations, fill_percentage, direct_orders=False):
+    """One day of the automation loop via the shared engine. Returns the day's log messages."""
+    messages = []
+    settings = engine.make_settings(locations, fill_percentage=fill_percentage, direct_orders=direct_orders)
+    await engine.run_day(page, mode, settings, lambda msg, color="black": messages.append(msg))
+    return messages
+
+
+async def run_benchmark(args):
+    botlog.configure("DEBUG" if args.verbose else "ERROR")
+    if args.trace:
+        tracing.enable(args.trace)
+    game = fake_game.game_from_args(args)
+    server, url = fake_game.start_server(game)
+    browser = await launch(headless=not args.headful, args=['--no-sandbox'])
+    rows = []
+    try:
+        page = await browser.newPage()
+        await page.goto(url)
+        await page.waitForSelector('#RTL .kpi_title')
+        if args.lean:
+            await lean_mode.enable(page)
+        game_api.set_active_product_set(args.product_set)
+        game_api.set_active_location_set(args.location_set)
+
+        mirror = None
+        if args.mirror:
+            mirror = kpi_mirror.KpiMirror(page, game_api.ALL_PRODUCTS)
+            await mirror.attach()
+            await mirror.wait_for_change(timeout=5)
+        counter = RoundTripCounter(page)
+        limiter = game_api.get_rate_limiter(page)
+        locations = await game_api.get_owned_retail_locations(page)
+        day = (await game_api.get_current_day(page))['current']
+
+        print(f"{'day':>4} {'wall s':>8} {'round-trips':>12} {'rate limits':>12} {'failed':>7} {'overran':>8}")
+        for _ in range(args.bench_days):
+            tracing.set_day(day)
+            start_round_trips, start_hits, start = counter.count, limiter.limit_hits, time.perf_counter()
+            results = await run_day_pass(page, args.mode, locations, args.fill, args.direct)
+            wall = time.perf_counter() - start
+            new_day = (await game_api.get_current_day(page))['current']
+            row = {
+                "day": day,
+                "wall_s": round(wall, 3),
+                "round_trips": counter.count - start_round_trips,
+                "rate_limit_hits": limiter.limit_hits - start_hits,
+                "failed": sum(1 for r in results if "fail" in r.lower() or "SKIPPED" in r),
+                "overran": new_day != day,
+            }
+            rows.append(row)
+            print(f"{row['day']:>4} {row['wall_s']:>8.2f} {row['round_trips']:>12} {row['rate_limit_hits']:>12} "
+                  f"{row['failed']:>7} {str(row['overran']):>8}")
+            if new_day >= game.total_days:
+                break
+            if new_day == day:
+                day = (await game_api.wait_for_next_day(page, day, timeout=args.day_length * 2 + 5))['current']
+            else:
+                day = new_day
+        if mirror:
+            mismatches = await mirror.verify()
+            print(f"KPI mirror: {mirror.pushes} pushes, {len(mismatches)} mismatch(es) against a full re-scrape")
+            for mismatch in mismatches:
+                print(f"    {mismatch}")
+    finally:
+        await browser.close()
+        server.shutdown()
+        tracing.disable()
+
+    if rows:
+        count = len(rows)
+        print(f"\nMean over {count} day(s): {sum(r['wall_s'] for r in rows) / count:.2f} s, "
+              f"{sum(r['round_trips'] for r in rows) / count:.1f} round-trips, "
+              f"{sum(r['rate_limit_hits'] for r in rows) / count:.2f} rate-limit hits per day")
+    print(f"Server stats: {game.stats}")
+    print(f"\nIn-page waits:\n{game_api.wait_stats_report()}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"days": rows, "server": game.stats, "waits": game_api.WAIT_STATS, "config": vars(args)}, f,
+                      indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the daily automation pass against a fake game.")
+    fake_game.add_game_arguments(parser)
+    parser.add_argument("--mode", default="full", choices=["retail", "service", "full"])
+    parser.add_argument("--fill", type=int, default=100, help="Target fill percentage")
+    parser.add_argument("--direct", action="store_true", help="Send orders directly once the form is learned")
+    parser.add_argument("--lean", action="store_true", help="Run the page in lean mode")
+    parser.add_argument("--mirror", action="store_true", help="Read the KPI panel from a pushed KPI mirror")
+    parser.add_argument("--bench-days", type=int, default=5, help="Number of game days to measure")
+    parser.add_argument("--headful", action="store_true", help="Show the browser window")
+    parser.add_argument("--verbose", action="store_true", help="Show game_api's log, down to DEBUG")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--trace", help="Write Chrome trace files (one per day) into this directory")
+    asyncio.get_event_loop().run_until_complete(run_benchmark(parser.parse_args()))
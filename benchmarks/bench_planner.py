@@ -0,0 +1,131 @@
+# bench_planner.py
+# Microbenchmark of the pure planning core (planner.plan_orders) over thousands of synthetic locations,
+# for every product set. No browser or game needed. --batch instead compares planning all the locations one by one
+# with planning them in one NumPy batch (planner.plan_locations), and checks that both give the same orders.
+#   python benchmarks/bench_planner.py --locations 5000
+#   python benchmarks/bench_planner.py --locations 5000 --batch
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import game_api  # noqa: E402
+import planner  # noqa: E402
+
+FILL_PERCENTAGES = [100, 120, 140, 150, 160]
+TOTAL_M2 = [500, 1000, 2500, 5000, 12000]
+
+
+def synthetic_locations(catalog, count, seed=0):
+    """Random (stock, used_m2, total_m2, priorities, fill %) cases, from empty stores to overfull ones."""
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        total_m2 = rng.choice(TOTAL_M2)
+        fullness = rng.random() * 1.2  # Up to 120% of the store's space taken up by stock
+        stock = {}
+        for product in catalog.products:
+            share = fullness * total_m2 * rng.random() / len(catalog.products)
+            stock[product] = int(share / catalog.space_usage[product])
+        used_m2 = int(sum(stock[p] * catalog.space_usage[p] for p in catalog.products)) + rng.randint(0, 50)
+        priorities = rng.sample(catalog.products, rng.randint(0, 2))
+        cases.append((stock, used_m2, total_m2, priorities, rng.choice(FILL_PERCENTAGES)))
+    return cases
+
+
+def bench_product_set(name, count, repeat, seed):
+    catalog = planner.Catalog(game_api.PRODUCT_SETS[name])
+    cases = synthetic_locations(catalog, count, seed)
+    timings = []
+    scaled_back = 0
+    for stock, used_m2, total_m2, priorities, fill in cases:
+        quotas = planner.product_quotas(total_m2 * fill / 100.0, catalog.products, priorities)
+        gaps = planner.space_to_fill(stock, quotas, catalog)
+        scaled_back += planner.orders_from_gaps(gaps, total_m2 - used_m2, catalog, priorities)[1]
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            planner.plan_orders(stock, used_m2, total_m2, catalog, priorities, fill)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    timings.sort()
+    total = sum(timings)
+    return {
+        "product_set": name,
+        "locations": count,
+        "scaled_back": scaled_back,
+        "total_ms": round(total * 1000, 2),
+        "mean_us": round(total / count * 1e6, 2),
+        "p50_us": round(timings[count // 2] * 1e6, 2),
+        "p99_us": round(timings[min(count - 1, int(count * 0.99))] * 1e6, 2),
+        "max_us": round(timings[-1] * 1e6, 2),
+        "locations_per_s": round(count / total) if total else None,
+    }
+
+
+def bench_batch(name, count, repeat, seed):
+    catalog = planner.Catalog(game_api.PRODUCT_SETS[name])
+    cases = synthetic_locations(catalog, count, seed)
+    planner.plan_locations(cases[:1], catalog)  # Builds the catalog's lot combinations outside the timing
+    scalar_best = batch_best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scalar = [planner.plan_orders(stock, used_m2, total_m2, catalog, priorities, fill)
+                  for stock, used_m2, total_m2, priorities, fill in cases]
+        elapsed = time.perf_counter() - start
+        scalar_best = elapsed if scalar_best is None else min(scalar_best, elapsed)
+        start = time.perf_counter()
+        batch = planner.plan_locations(cases, catalog)
+        elapsed = time.perf_counter() - start
+        batch_best = elapsed if batch_best is None else min(batch_best, elapsed)
+    return {
+        "product_set": name,
+        "locations": count,
+        "scalar_ms": round(scalar_best * 1000, 2),
+        "batch_ms": round(batch_best * 1000, 2),
+        "speedup": round(scalar_best / batch_best, 1) if batch_best else None,
+        "mismatches": sum(a != b for a, b in zip(scalar, batch)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark planner.plan_orders across all product sets.")
+    parser.add_argument("--locations", type=int, default=5000, help="Synthetic locations per product set")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per location; the fastest one counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--product-set", action="append", choices=sorted(game_api.PRODUCT_SETS),
+                        help="Only these product sets (repeatable; default: all)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Compare per-location planning with one NumPy batch (needs numpy)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    if args.batch and planner.np is None:
+        parser.error("--batch needs numpy (pip install numpy)")
+
+    rows = []
+    if args.batch:
+        print(f"{'set':<12} {'locations':>9} {'scalar ms':>10} {'batch ms':>10} {'speedup':>8} {'differ':>7}")
+        for name in args.product_set or list(game_api.PRODUCT_SETS):
+            row = bench_batch(name, args.locations, args.repeat, args.seed)
+            rows.append(row)
+            print(f"{name:<12} {row['locations']:>9} {row['scalar_ms']:>10.1f} {row['batch_ms']:>10.1f} "
+                  f"{row['speedup']:>7}x {row['mismatches']:>7}")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({"results": rows, "config": vars(args)}, f, indent=2)
+        sys.exit(1 if any(row["mismatches"] for row in rows) else 0)
+
+    print(f"{'set':<12} {'locations':>9} {'scaled':>7} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'max us':>9} "
+          f"{'loc/s':>9}")
+    for name in args.product_set or list(game_api.PRODUCT_SETS):
+        row = bench_product_set(name, args.locations, args.repeat, args.seed)
+        rows.append(row)
+        print(f"{name:<12} {row['locations']:>9} {row['scaled_back']:>7} {row['mean_us']:>9.1f} {row['p50_us']:>9.1f} "
+              f"{row['p99_us']:>9.1f} {row['max_us']:>9.1f} {row['locations_per_s']:>9}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"results": rows, "config": vars(args)}, f, indent=2)
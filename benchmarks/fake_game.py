@@ -0,0 +1,459 @@
+# fake_game.py
+# A local stand-in for a MonsoonSIM game, reproducing the parts of the DOM the bot depends on:
+# the #KPI_DAY____ counter, the #RTL KPI panel, the retail vendor page (#boxmodrtl / #MENU2_retail_vendor /
+# vendor-box BUY_FG links), the #facebox order form, the service request tabs and the "Slow down" banner.
+#
+# Run it on its own to point a debug Chrome at it:
+#   python benchmarks/fake_game.py --port 8133 --day-length 10
+#   chrome --remote-debugging-port=9222 --host-resolver-rules="MAP sim0.monsoonsim.com 127.0.0.1"
+#   (then open http://sim0.monsoonsim.com:8133/ so the bot's "monsoonsim.com" URL match finds it)
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import game_api  # noqa: E402  (product and location tables)
+
+PRODUCT_SETS = {
+    "Juice": game_api.JUICE_SET,
+    "Mask": game_api.MASK_SET,
+    "Car": game_api.CAR_SET,
+    "Coffee": game_api.COFFEE_SET,
+    "Electronics": game_api.ELECTRONICS_SET,
+}
+
+LOCATION_SETS = {
+    "Indonesia": game_api.INDONESIA_LOCATION_ID_MAP,
+    "China": game_api.CHINA_LOCATION_ID_MAP,
+}
+
+SERVICE_TABS = ["Marketing Srv", "Franchise Srv", "Technical Srv"]
+
+
+class FakeGame:
+    """Server-side state of one fake game. Days advance on wall-clock time, every day_length seconds."""
+
+    def __init__(self, product_set="Juice", location_set="Indonesia", locations=7, total_days=30, day_length=10.0,
+                 max_clicks_per_second=5, vendors=3, service_requests_per_day=2, seed=0):
+        self.product_set = PRODUCT_SETS[product_set]
+        self.products = list(self.product_set["code_map"].keys())
+        self.location_ids = dict(list(LOCATION_SETS[location_set].items())[:locations])
+        self.total_days = total_days
+        self.day_length = day_length
+        self.max_clicks_per_second = max_clicks_per_second
+        self.service_requests_per_day = service_requests_per_day
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.day = 1
+        self.stats = {"orders": 0, "rejected_orders": 0, "service_handled": 0, "service_rejected": 0,
+                      "rate_limit_hits": 0}
+
+        # Size every store so that a full store holds a few of the largest lots of an average product
+        average_space = sum(self.product_set["space_usage"].values()) / len(self.products)
+        lot_space = max(self.product_set["valid_order_quantities"]) * average_space
+        self.locations = {}
+        for name in self.location_ids:
+            total_m2 = int(lot_space * self.random.uniform(2, 6)) + 1
+            stock = {p: int(total_m2 * self.random.uniform(0.05, 0.25) / self.product_set["space_usage"][p])
+                     for p in self.products}
+            self.locations[name] = {"total_m2": total_m2, "stock": stock}
+        self.pending_orders = []  # (arrival_day, location, {product: qty})
+
+        self.vendors = []
+        for i in range(vendors):
+            self.vendors.append({
+                "name": f"VFG{i + 1}",
+                "lead_time": 1 + i % 2,
+                "prices": {p: round(self.random.uniform(1, 3) * (1 + i * 0.1), 2) for p in self.products},
+            })
+        self.service_requests = {}
+        self.next_request_id = 1
+        self._add_service_requests()
+
+    # --- Simulation ---
+    def _add_service_requests(self):
+        for _ in range(self.service_requests_per_day):
+            self.service_requests[self.next_request_id] = [self.random.randint(0, 3) for _ in SERVICE_TABS]
+            self.next_request_id += 1
+
+    def _advance_to_now(self):
+        """Rolls the simulation forward to the day the wall clock says it is."""
+        target_day = min(self.total_days, 1 + int((time.monotonic() - self.start_time) / self.day_length))
+        while self.day < target_day:
+            self.day += 1
+            for location in self.locations.values():
+                for product, qty in location["stock"].items():
+                    location["stock"][product] = max(0, qty - int(qty * self.random.uniform(0.05, 0.3)))
+            arrived = [o for o in self.pending_orders if o[0] <= self.day]
+            self.pending_orders = [o for o in self.pending_orders if o[0] > self.day]
+            for _, name, items in arrived:
+                for product, qty in items.items():
+                    self.locations[name]["stock"][product] += qty
+            self._add_service_requests()
+
+    def _used_m2(self, name):
+        space = self.product_set["space_usage"]
+        return int(round(sum(qty * space[p] for p, qty in self.locations[name]["stock"].items())))
+
+    def kpi(self):
+        with self.lock:
+            self._advance_to_now()
+            return {
+                "day": self.day,
+                "total": self.total_days,
+                "locations": [{"name": name, "used_m2": self._used_m2(name), "total_m2": loc["total_m2"],
+                               "stock": dict(loc["stock"])} for name, loc in self.locations.items()],
+            }
+
+    def place_order(self, form):
+        with self.lock:
+            self._advance_to_now()
+            vendor = next((v for v in self.vendors if v["name"] == form.get("vendor")), None)
+            name = next((n for n, i in self.location_ids.items() if i == form.get("destination_rtl")), None)
+            if vendor is None or name is None:
+                self.stats["rejected_orders"] += 1
+                return {"ok": False, "error": "Unknown vendor or destination"}
+            valid = set(self.product_set["valid_order_quantities"])
+            items = {}
+            for product, code in self.product_set["code_map"].items():
+                qty = int(form.get(code, "0") or 0)
+                if qty and qty not in valid:
+                    self.stats["rejected_orders"] += 1
+                    return {"ok": False, "error": f"Invalid quantity {qty} for {code}"}
+                if qty:
+                    items[product] = qty
+            self.pending_orders.append((self.day + vendor["lead_time"], name, items))
+            self.stats["orders"] += 1
+            return {"ok": True}
+
+    def handle_service(self, form):
+        with self.lock:
+            request_id = int(form.get("id", "0"))
+            mandays = self.service_requests.get(request_id)
+            assigned = [int(form.get(f"staff{i}", "0")) for i in range(len(SERVICE_TABS))]
+            if mandays is None or any(a < m for a, m in zip(assigned, mandays)):
+                self.stats["service_rejected"] += 1
+                return {"ok": False, "error": "Not enough staff assigned"}
+            del self.service_requests[request_id]
+            self.stats["service_handled"] += 1
+            return {"ok": True}
+
+    def record_rate_limit(self):
+        with self.lock:
+            self.stats["rate_limit_hits"] += 1
+            return {"ok": True}
+
+    # --- HTML ---
+    def order_form_html(self, vendor_name):
+        quantities = "".join(f'<option value="{q}">{q:,}</option>'
+                             for q in self.product_set["valid_order_quantities"])
+        destinations = "".join(f'<option value="{i}">{n}</option>' for n, i in self.location_ids.items())
+        rows = "".join(f'<div class="form-row"><label for="{code}">{product}</label>'
+                       f'<select id="{code}" name="{code}"><option value="0">0</option>{quantities}</select></div>'
+                       for product, code in self.product_set["code_map"].items())
+        return (f'<form id="order_form" action="index.php?cmd=BUY_FG_SUBMIT" method="post">'
+                f'<h3>Buy finished goods from {vendor_name}</h3>'
+                f'<input type="hidden" name="vendor" value="{vendor_name}">'
+                f'<div class="form-row"><label for="destination_rtl">Destination</label>'
+                f'<select id="destination_rtl" name="destination_rtl">{destinations}</select></div>'
+                f'{rows}<button type="button" id="submit_button">Submit</button></form>')
+
+    def service_form_html(self, request_id):
+        mandays = self.service_requests.get(request_id)
+        if mandays is None:
+            return "<p>This request has already been handled.</p>"
+        required = "".join(f'<div class="col-md-5">{tab} - Required Mandays : {m}</div>'
+                           for tab, m in zip(SERVICE_TABS, mandays))
+        tabs = "".join(f'<li class="ui-tabs-tab" aria-controls="srv-tab-{i}"><a href="#srv-tab-{i}">{tab}</a></li>'
+                       for i, tab in enumerate(SERVICE_TABS))
+        panels = ""
+        for i in range(len(SERVICE_TABS)):
+            staff = "".join(f'<div class="circle thecb{" disabled" if s % 4 == 3 else ""}"></div>' for s in range(8))
+            panels += (f'<div id="srv-tab-{i}" class="ui-tabs-panel" data-index="{i}" '
+                       f'style="display:{"block" if i == 0 else "none"}">{staff}</div>')
+        return (f'<form id="srv_form" data-id="{request_id}"><div class="row">{required}</div>'
+                f'<div class="ui-tabs"><ul>{tabs}</ul>{panels}</div>'
+                f'<button type="button" id="submit_button">Submit</button></form>')
+
+
+PAGE_HTML = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>MonsoonSIM (local stand-in)</title>
+<link rel="stylesheet" href="/static/fonts.css">
+<style>
+  body { font-family: "GameFont", sans-serif; margin: 0; }
+  #topbar { background: #234; color: #fff; padding: 6px; }
+  .boxmod { display: inline-block; padding: 8px; margin: 4px; background: #ddd; cursor: pointer; }
+  #menu2 a { margin: 4px; }
+  #RTL { float: right; width: 280px; border-left: 1px solid #ccc; }
+  #RTL li { list-style: none; }
+  .right { float: right; }
+  .vendor-box { border: 1px solid #999; margin: 6px; padding: 6px; display: inline-block; }
+  #facebox { position: fixed; top: 80px; left: 30%; background: #fff; border: 2px solid #333; padding: 12px;
+             opacity: 0; transition: opacity 0.3s; }
+  #facebox.shown { opacity: 1; }
+  #slowdown { position: fixed; top: 0; left: 40%; background: #c00; color: #fff; padding: 6px; }
+  .circle.thecb { display: inline-block; width: 18px; height: 18px; border-radius: 9px; border: 1px solid #333;
+                  margin: 2px; transition: background 0.2s; }
+  .circle.thecb.selected { background: #3a3; }
+  .circle.thecb.disabled { background: #999; }
+</style></head>
+<body>
+<div id="topbar"><img src="/static/logo.png" height="20"> Day <span id="KPI_DAY____">1 / 1</span></div>
+<div id="modules">
+  <div id="boxmodrtl" class="boxmod">Retail</div>
+  <div id="boxmodsrv" class="boxmod">Service</div>
+</div>
+<div id="menu2"></div>
+<div id="RTL"><ul id="rtl_list"></ul></div>
+<div id="content"></div>
+<div id="facebox" style="display:none"><div class="content"></div></div>
+<div id="slowdown" style="display:none">Slow down, you click too fast</div>
+<script src="/static/analytics.js"></script>
+<script>
+(function () {
+  const api = (cmd, params, body) => {
+    const url = 'index.php?cmd=' + cmd + (params ? '&' + new URLSearchParams(params) : '');
+    const options = body ? {method: 'POST', body: body, credentials: 'same-origin'} : {credentials: 'same-origin'};
+    return fetch(url, options).then(r => r.headers.get('content-type').includes('json') ? r.json() : r.text());
+  };
+
+  // --- Rate limit: more than MAX_CLICKS clicks on links/buttons/menus in one second shows the banner ---
+  const MAX_CLICKS = __MAX_CLICKS__;
+  let clickTimes = [];
+  let bannerTimer = null;
+  document.addEventListener('click', (event) => {
+    if (!event.target.closest('a, button, .boxmod')) return;
+    const now = performance.now();
+    clickTimes = clickTimes.filter(t => now - t < 1000);
+    clickTimes.push(now);
+    if (clickTimes.length > MAX_CLICKS) {
+      event.preventDefault();
+      event.stopImmediatePropagation();
+      const banner = document.getElementById('slowdown');
+      banner.style.display = 'block';
+      clearTimeout(bannerTimer);
+      bannerTimer = setTimeout(() => banner.style.display = 'none', 2000);
+      api('RATE_LIMIT', null, new URLSearchParams());
+    }
+  }, true);
+
+  // --- Facebox (animated like the real one) ---
+  const facebox = document.getElementById('facebox');
+  const openFacebox = (html) => {
+    facebox.querySelector('.content').innerHTML = html;
+    facebox.style.display = 'block';
+    requestAnimationFrame(() => requestAnimationFrame(() => facebox.classList.add('shown')));
+  };
+  const closeFacebox = () => {
+    facebox.classList.remove('shown');
+    const duration = parseFloat(getComputedStyle(facebox).transitionDuration) * 1000;
+    setTimeout(() => { facebox.style.display = 'none'; }, duration);
+  };
+
+  // --- Top KPI bar and retail KPI panel, refreshed like the game's own polling ---
+  let lastKpi = '';
+  const renderKpi = (kpi) => {
+    const dayText = kpi.day + ' / ' + kpi.total;
+    const dayEl = document.getElementById('KPI_DAY____');
+    if (dayEl.textContent !== dayText) dayEl.textContent = dayText;
+    const json = JSON.stringify(kpi.locations);
+    if (json === lastKpi) return;
+    lastKpi = json;
+    const list = document.getElementById('rtl_list');
+    list.innerHTML = kpi.locations.map(loc =>
+      '<div class="kpi_title">Retail&nbsp;' + loc.name + '</div>' +
+      '<li>Space utilization<div>' + loc.used_m2.toLocaleString('en-US') + ' / ' +
+      loc.total_m2.toLocaleString('en-US') + ' m&sup2;</div></li>' +
+      Object.entries(loc.stock).map(([p, q]) =>
+        '<li>' + p + '<span class="right">' + q.toLocaleString('en-US') + '</span></li>').join('')
+    ).join('');
+  };
+  const pollKpi = () => api('KPI').then(renderKpi).catch(() => {}).finally(() => setTimeout(pollKpi, 200));
+  pollKpi();
+
+  // --- Module menus ---
+  const menu2 = document.getElementById('menu2');
+  const content = document.getElementById('content');
+  document.getElementById('boxmodrtl').addEventListener('click', () => {
+    menu2.innerHTML = '<a href="#" id="MENU2_retail_vendor">Vendors</a>';
+  });
+  document.getElementById('boxmodsrv').addEventListener('click', () => {
+    menu2.innerHTML = '<a href="#" id="MENU2_SRVincm">Incoming Requests</a>';
+  });
+  menu2.addEventListener('click', (event) => {
+    event.preventDefault();
+    if (event.target.id === 'MENU2_retail_vendor') {
+      api('VENDORS').then(vendors => {
+        content.innerHTML = vendors.map(v =>
+          '<div class="vendor-box"><div class="vendor-name">' + v.name + '</div>' +
+          Object.entries(v.prices).map(([p, price]) => '<div class="vendor-info">Price ' + p + ' : $' + price +
+                                                      '</div>').join('') +
+          '<div class="vendor-info">Lead time : ' + v.lead_time + ' day(s)</div>' +
+          '<a href="index.php?cmd=BUY_FG&vendor=' + v.name + '">Buy</a></div>').join('');
+      });
+    } else if (event.target.id === 'MENU2_SRVincm') {
+      api('SRV_LIST').then(requests => {
+        content.innerHTML = requests.length ? requests.map(id =>
+          '<div class="srv-request"><a href="index.php?cmd=SRV_INCOMING&id=' + id + '">Service request #' + id +
+          '</a></div>').join('') : '<p>No incoming requests.</p>';
+      });
+    }
+  });
+
+  // --- Content links open their facebox dialogs ---
+  content.addEventListener('click', (event) => {
+    const link = event.target.closest('a');
+    if (!link) return;
+    event.preventDefault();
+    const params = new URLSearchParams(link.getAttribute('href').split('?')[1]);
+    const cmd = params.get('cmd');
+    params.delete('cmd');
+    api(cmd, Object.fromEntries(params)).then(openFacebox);
+  });
+
+  // --- Facebox forms ---
+  facebox.addEventListener('click', (event) => {
+    const circle = event.target.closest('.circle.thecb');
+    if (circle && !circle.classList.contains('disabled')) circle.classList.toggle('selected');
+    const tab = event.target.closest('.ui-tabs-tab');
+    if (tab) {
+      event.preventDefault();
+      facebox.querySelectorAll('.ui-tabs-panel').forEach(p =>
+        p.style.display = p.id === tab.getAttribute('aria-controls') ? 'block' : 'none');
+    }
+    if (event.target.id !== 'submit_button') return;
+    const orderForm = document.getElementById('order_form');
+    const serviceForm = document.getElementById('srv_form');
+    let request;
+    if (orderForm) {
+      request = fetch(orderForm.getAttribute('action'),
+                      {method: 'POST', body: new URLSearchParams(new FormData(orderForm)),
+                       credentials: 'same-origin'});
+    } else if (serviceForm) {
+      const body = new URLSearchParams({id: serviceForm.dataset.id});
+      serviceForm.querySelectorAll('.ui-tabs-panel').forEach(panel =>
+        body.set('staff' + panel.dataset.index, panel.querySelectorAll('.circle.thecb.selected').length));
+      request = api('SRV_SUBMIT', null, body);
+      request.then(() => {
+        const link = content.querySelector('a[href$="id=' + serviceForm.dataset.id + '"]');
+        if (link) link.parentElement.remove();
+      });
+    }
+    if (request) request.then(closeFacebox);
+  });
+})();
+</script>
+</body></html>
+'''
+
+
+def make_handler(game):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+        def _send(self, body, content_type):
+            data = body if isinstance(body, bytes) else body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, value):
+            self._send(json.dumps(value), "application/json")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            cmd = query.get("cmd")
+            if url.path in ("/", "/index.html"):
+                self._send(PAGE_HTML.replace("__MAX_CLICKS__", str(game.max_clicks_per_second)), "text/html")
+            elif url.path == "/stats":
+                self._send_json(game.stats)
+            elif url.path == "/static/logo.png":
+                self._send(b"\x89PNG\r\n\x1a\n" + bytes(64 * 1024), "image/png")
+            elif url.path == "/static/fonts.css":
+                self._send('@font-face { font-family: "GameFont"; src: url("/static/game.woff2"); }', "text/css")
+            elif url.path == "/static/game.woff2":
+                self._send(bytes(32 * 1024), "font/woff2")
+            elif url.path == "/static/analytics.js":
+                self._send("window.__analytics = true;", "application/javascript")
+            elif cmd == "KPI":
+                self._send_json(game.kpi())
+            elif cmd == "VENDORS":
+                self._send_json(game.vendors)
+            elif cmd == "BUY_FG":
+                self._send(game.order_form_html(query.get("vendor", "")), "text/html")
+            elif cmd == "SRV_LIST":
+                with game.lock:
+                    self._send_json(sorted(game.service_requests))
+            elif cmd == "SRV_INCOMING":
+                with game.lock:
+                    self._send(game.service_form_html(int(query.get("id", "0"))), "text/html")
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            cmd = parse_qs(url.query).get("cmd", [None])[0]
+            length = int(self.headers.get("Content-Length", 0))
+            form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+            if cmd == "BUY_FG_SUBMIT":
+                self._send_json(game.place_order(form))
+            elif cmd == "SRV_SUBMIT":
+                self._send_json(game.handle_service(form))
+            elif cmd == "RATE_LIMIT":
+                self._send_json(game.record_rate_limit())
+            else:
+                self.send_error(404)
+
+    return Handler
+
+
+def start_server(game, host="127.0.0.1", port=0):
+    """Serves the game from a background thread. Returns (server, base_url); call server.shutdown() to stop."""
+    server = ThreadingHTTPServer((host, port), make_handler(game))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+def add_game_arguments(parser):
+    """Adds the fake game's configuration flags to an argparse parser."""
+    parser.add_argument("--product-set", default="Juice", choices=sorted(PRODUCT_SETS))
+    parser.add_argument("--location-set", default="Indonesia", choices=sorted(LOCATION_SETS))
+    parser.add_argument("--locations", type=int, default=7, help="Number of owned retail locations (max 7)")
+    parser.add_argument("--days", type=int, default=30, help="Total days in the game")
+    parser.add_argument("--day-length", type=float, default=10.0, help="Seconds per game day")
+    parser.add_argument("--max-clicks", type=int, default=5, help="Clicks per second before 'Slow down'")
+    parser.add_argument("--vendors", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def game_from_args(args):
+    return FakeGame(product_set=args.product_set, location_set=args.location_set, locations=args.locations,
+                    total_days=args.days, day_length=args.day_length, max_clicks_per_second=args.max_clicks,
+                    vendors=args.vendors, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local MonsoonSIM stand-in game.")
+    add_game_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8133)
+    args = parser.parse_args()
+    server, url = start_server(game_from_args(args), args.host, args.port)
+    print(f"Fake MonsoonSIM game running at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
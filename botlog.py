@@ -0,0 +1,121 @@
+# botlog.py
+# Structured logging for the bot, on the standard logging module under the "monsoonsim" logger.
+# Every record carries the session (game), day and location it was logged in, taken from context variables, so
+# the lines of concurrent games can be told apart. Records are handed to a queue on the event loop's thread
+# and written by a background thread, as text or JSON lines. Below the configured level (INFO by default)
+# nothing is formatted or written; the step-by-step chatter is logged at DEBUG.
+#   botlog.configure(level="DEBUG", json_lines=True, path="bot.log.jsonl")
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+ROOT = "monsoonsim"
+CONTEXT_FIELDS = ("session", "day", "location")
+
+# The game, day and retail location being worked on in the current context (see context())
+_CONTEXT = {name: contextvars.ContextVar(f"monsoonsim_log_{name}", default=None) for name in CONTEXT_FIELDS}
+_listener = None
+
+
+def get_logger(name):
+    """The logger for one of the bot's modules, e.g. get_logger("game_api")."""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """Tags every record logged inside the block (and in tasks it starts) with these fields, e.g. location="Jakarta"."""
+    tokens = [(_CONTEXT[name], _CONTEXT[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def set_context(**fields):
+    """Sets context fields until the current task ends (e.g. the day, once per loop iteration)."""
+    for name, value in fields.items():
+        _CONTEXT[name].set(value)
+
+
+class _ContextFilter(logging.Filter):
+    """Copies the context fields onto the record, on the thread that logs it (where the context variables live)."""
+
+    def filter(self, record):
+        for name, var in _CONTEXT.items():
+            setattr(record, name, var.get())
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines: time, level, then the context that is set, then the message."""
+
+    def format(self, record):
+        context_text = ""
+        if getattr(record, "session", None) is not None:
+            context_text += f"[{record.session}] "
+        if getattr(record, "day", None) is not None:
+            context_text += f"[day {record.day}] "
+        if getattr(record, "location", None) is not None:
+            context_text += f"[{record.location}] "
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {context_text}{record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: t, level, logger, msg, the context fields that are set and any extra= fields."""
+    _STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {"t": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "msg": record.getMessage()}
+        for name, value in vars(record).items():
+            if name not in self._STANDARD and value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure(level="INFO", json_lines=False, path=None):
+    """
+    Sends the bot's logging to stdout (or to the file at path) through a queue and a writer thread.
+    Safe to call again, e.g. to change the level; the previous writer is stopped first.
+    """
+    global _listener
+    shutdown()
+    target = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stdout)
+    target.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger(ROOT)
+    for old in [h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, target)
+    _listener.start()
+
+
+def shutdown():
+    """Writes out everything still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,135 @@
+# connection.py
+# Targeted attachment to the game tabs. Instead of building a Page for every open tab (browser.pages()) and then
+# filtering by URL, the DevTools target list (GET <browser_url>/json/list) is filtered over HTTP first and only the
+# matching tabs are attached to. A BrowserLink also reconnects by itself when the DevTools websocket drops,
+# so sessions can re-resolve their tab and carry on.
+import asyncio
+import json
+import urllib.request
+
+from pyppeteer import connect
+
+import botlog
+
+_log = botlog.get_logger("connection")
+
+HTTP_TIMEOUT = 5  # Seconds for a DevTools HTTP request
+ATTACH_TIMEOUT = 5  # Seconds to wait for a listed target to show up on the websocket
+
+
+def _get_json(url):
+    with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+async def list_targets(browser_url, url_fragments=None):
+    """
+    The browser's tabs from its /json/list endpoint, as {"id", "url", "title", ...} dictionaries, keeping only
+    those whose URL contains one of the fragments (all tabs if none are given). Nothing is attached to.
+    """
+    loop = asyncio.get_event_loop()
+    targets = await loop.run_in_executor(None, _get_json, browser_url.rstrip('/') + '/json/list')
+    return [t for t in targets if t.get('type') == 'page'
+            and (not url_fragments or any(fragment in t.get('url', '') for fragment in url_fragments))]
+
+
+async def attach(browser, target_id, timeout=ATTACH_TIMEOUT):
+    """Builds the Page of one target (by its DevTools id), without touching any other tab."""
+    deadline = asyncio.get_event_loop().time() + timeout
+    while True:
+        # Target objects are cheap; only target.page() attaches to the tab
+        target = next((t for t in browser.targets() if t._targetId == target_id), None)
+        if target is not None:
+            page = await target.page()
+            if page is not None:
+                return page
+        if asyncio.get_event_loop().time() > deadline:
+            raise Exception(f"Target {target_id} did not show up in the browser.")
+        await asyncio.sleep(0.05)
+
+
+class BrowserLink:
+    """
+    A DevTools connection to one Chrome instance that comes back by itself: when the websocket drops, it reconnects
+    in the background with exponential backoff (up to max_backoff seconds between tries).
+    """
+
+    def __init__(self, browser_url, max_backoff=30):
+        self.browser_url = browser_url.rstrip('/')
+        self.max_backoff = max_backoff
+        self.browser = None
+        self.reconnects = 0
+        self._connected = asyncio.Event()
+        self._reconnecting = None
+        self._closed = False
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    async def open(self):
+        """Connects to the browser's websocket (found through /json/version). Raises if Chrome can't be reached."""
+        loop = asyncio.get_event_loop()
+        version = await loop.run_in_executor(None, _get_json, self.browser_url + '/json/version')
+        self.browser = await connect(browserWSEndpoint=version['webSocketDebuggerUrl'], defaultViewport=None)
+        self.browser.on('disconnected', self._on_disconnected)
+        self._connected.set()
+        return self.browser
+
+    def _on_disconnected(self):
+        self._connected.clear()
+        if self._closed or (self._reconnecting and not self._reconnecting.done()):
+            return
+        _log.warning("Lost the DevTools connection to %s. Reconnecting...", self.browser_url)
+        self._reconnecting = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        attempt = 0
+        while not self._closed:
+            await asyncio.sleep(min(self.max_backoff, 2 ** attempt))
+            attempt += 1
+            try:
+                await self.open()
+                self.reconnects += 1
+                _log.info("Reconnected to %s (attempt %d).", self.browser_url, attempt)
+                return
+            except Exception as e:
+                _log.warning("Reconnect attempt %d to %s failed: %s", attempt, self.browser_url, e)
+
+    async def wait_connected(self, timeout=None):
+        """Waits until the link is up again (e.g. after a drop)."""
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def find_pages(self, url_fragments):
+        """Attaches to every tab matching the fragments, in /json/list order. Returns [(target id, page)]."""
+        await self.wait_connected()
+        targets = await list_targets(self.browser_url, url_fragments)
+        return [(target['id'], await attach(self.browser, target['id'])) for target in targets]
+
+    async def resolve(self, target_id, url_fragments, timeout=None, exclude=()):
+        """
+        Finds a game's tab again after a drop: the same target if it still exists, otherwise the one tab matching
+        the fragments that isn't in exclude (the target ids other games are driving). Returns (target id, page).
+        Raises if no such tab is open, or if several are and it can't tell which one is the game's.
+        """
+        await self.wait_connected(timeout)
+        targets = await list_targets(self.browser_url, url_fragments)
+        target = next((t for t in targets if t['id'] == target_id), None)
+        if target is None:
+            candidates = [t for t in targets if t['id'] not in exclude]
+            if not candidates:
+                raise Exception(f"No tab matching {url_fragments} is open any more.")
+            if len(candidates) > 1:
+                raise Exception(f"The tab is gone and {len(candidates)} other tabs match {url_fragments}. "
+                                f"Not guessing which one is the game's.")
+            target = candidates[0]
+        return target['id'], await attach(self.browser, target['id'])
+
+    async def close(self):
+        """Stops reconnecting and disconnects (the browser and its tabs stay open)."""
+        self._closed = True
+        if self._reconnecting:
+            self._reconnecting.cancel()
+        if self.browser and self.connected:
+            await self.browser.disconnect()
+        self._connected.clear()
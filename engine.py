@@ -0,0 +1,142 @@
+# engine.py
+# The daily automation loop, shared by the Tkinter GUI (DEBUGGER.py) and the headless runner (main.py).
+import logging
+
+import botlog
+import game_api
+import recorder
+import tracing
+
+MODES = ['retail', 'service', 'full']
+# The GUI's message colours, as log levels
+COLOR_LEVELS = {"red": logging.ERROR, "orange": logging.WARNING}
+
+_log = botlog.get_logger("engine")
+
+
+def print_log(msg, color="black"):
+    """Default logger for headless runs. Takes the same (msg, color) arguments as App.log_message."""
+    _log.log(COLOR_LEVELS.get(color, logging.INFO), msg)
+
+
+def make_settings(locations, presets=None, fill_percentage=100, fill_targets=None, direct_orders=False,
+                  vendor=None, max_lead_days=None):
+    """
+    Builds the settings dictionary the loop reads every day:
+    locations to replenish, per-location priority presets, the default fill % and per-location fill overrides,
+    whether orders may be sent directly once the vendor form has been learned, and the vendor to order from
+    (None: the cheapest in the day's vendor catalog that delivers within max_lead_days).
+    """
+    return {
+        "locations": list(locations),
+        "presets": dict(presets or {}),
+        "fill_percentage": fill_percentage,
+        "fill_targets": dict(fill_targets or {}),
+        "direct_orders": direct_orders,
+        "vendor": vendor,
+        "max_lead_days": max_lead_days,
+    }
+
+
+def _tally(stats, key):
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + 1
+
+
+async def run_day(page, mode, settings, log=print_log, stats=None):
+    """
+    Runs one day's pass: service requests, then replenishment of every retail location from a single snapshot.
+    If a stats dictionary is given, the outcomes are counted into it.
+    Returns False if the loop should stop (e.g. no locations to work on).
+    """
+    if mode in ['service', 'full']:
+        try:
+            service_results = await game_api.process_service_requests(page)
+            if not service_results:
+                log("Service Check: No new service requests found.", "blue")
+        except Exception as e:
+            log(f"Service Check: {e} Skipping.", "blue")
+            service_results = []
+        for request, service_result in service_results:
+            log(f"Service ({request}): {service_result}", "blue")
+            recorder.record("result", kind="service", request=request, result=service_result)
+            if service_result.startswith("Service request handled"):
+                _tally(stats, "service_handled")
+            else:
+                _tally(stats, "service_failed")
+
+    if mode in ['retail', 'full']:
+        locations = settings["locations"]
+        if not locations:
+            log(f"AUTO-STOP ({mode}): No locations fetched.", "red")
+            return False
+
+        # Read every location's space and stock in one go, then plan each store from it
+        snapshot = await game_api.get_retail_snapshot(page)
+        recorder.record("snapshot", snapshot=snapshot)
+
+        for location in locations:
+            prioritized_products = settings["presets"].get(location, [])
+            target_percentage = settings["fill_targets"].get(location, settings["fill_percentage"])
+            with botlog.context(location=location):
+                log(f"Using preset for {location}: {prioritized_products or 'None'}", "blue")
+                replenish_result = await game_api.procure_for_retail_location(
+                    page, location, prioritized_products, target_percentage, snapshot=snapshot,
+                    vendor_name=settings.get("vendor"), direct=settings.get("direct_orders", False),
+                    max_lead_days=settings.get("max_lead_days"))
+                log(f"Replenish ({location}): {replenish_result}")
+            recorder.record("result", kind="procure", location=location, result=replenish_result)
+            if replenish_result.startswith("Successfully ordered"):
+                _tally(stats, "orders_placed")
+            elif replenish_result.startswith("SKIPPED"):
+                _tally(stats, "locations_skipped")
+            elif replenish_result.startswith("No change"):
+                _tally(stats, "locations_unchanged")
+    return True
+
+
+async def run_automation_loop(page, mode, get_settings, log=print_log, stats=None, resume_after_day=None,
+                              on_day_done=None):
+    """
+    Runs the daily loop until the game ends or the task is cancelled.
+    get_settings is called at the start of every day, so settings changed mid-run apply from the next day on.
+    resume_after_day is the last day a previous run completed (see state_store.py): if the game is still on it,
+    the loop starts on the next day change instead of redoing it. on_day_done(day) is called after each day's pass.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown automation mode: {mode}")
+    config = game_api.active_config()
+    recorder.record("session", mode=mode, product_set=config.product_set, location_set=config.location_set)
+
+    while True:
+        current_day_info = await game_api.get_current_day(page)
+        current_day = current_day_info['current']
+        if resume_after_day is not None and current_day <= resume_after_day:
+            log(f"Day {current_day} was already done before the restart. Resuming on the next day.", "purple")
+            resume_after_day = None
+            # The previous run may have stopped anywhere in the day, so wait as long as it takes
+            day_info = await game_api.wait_for_next_day(page, current_day, timeout=0)
+            if day_info['current'] >= day_info['total']:
+                log("GAME OVER", "green")
+                break
+            continue
+        resume_after_day = None
+        tracing.set_day(current_day)
+        botlog.set_context(day=current_day)
+        log(f"--- Starting Day {current_day} ---", "purple")
+        settings = get_settings()
+        recorder.record("day", day=current_day, settings=settings)
+
+        if not await run_day(page, mode, settings, log, stats):
+            break
+        recorder.flush()
+        _tally(stats, "days")
+        if stats is not None:
+            stats["last_day"] = current_day
+        if on_day_done is not None:
+            on_day_done(current_day)
+
+        day_info = await game_api.wait_for_next_day(page, current_day)
+        if day_info['current'] >= day_info['total']:
+            log("GAME OVER", "green")
+            break
@@ -0,0 +1,169 @@
+# fleet.py
+# Runs the daily automation loop for several MonsoonSIM games (one tab each) concurrently on one event loop.
+import asyncio
+import time
+import urllib.parse
+
+import botlog
+import engine
+import game_api
+import kpi_mirror
+import lean_mode
+import recorder
+import tracing
+
+REATTACH_TIMEOUT = 120  # Seconds to wait for the link to come back before a re-attach attempt fails
+MAX_REATTACH_ATTEMPTS = 5
+
+_log = botlog.get_logger("fleet")
+
+
+class GameSession:
+    """One game being played: its page, its product/location configuration, its loop settings and its stats."""
+
+    def __init__(self, page, name=None, product_set="Juice", location_set="Indonesia", mode="full", settings=None,
+                 lean=False, mirror=False, recording=None, link=None, target_id=None, state=None):
+        if mode not in engine.MODES:
+            raise ValueError(f"Unknown automation mode: {mode}")
+        self.page = page
+        self.name = name or page.url
+        self.link = link  # The connection.BrowserLink the page came from; lets the session re-attach after a drop
+        self.target_id = target_id
+        self.host = urllib.parse.urlsplit(page.url).netloc  # To find the game again if its tab was reopened
+        self.config = game_api.GameConfig(product_set, location_set)
+        self.mode = mode
+        self.settings = settings or engine.make_settings([])
+        self.lean = lean  # Run the tab in lean mode (see lean_mode.py) while the loop drives it
+        self.mirror = kpi_mirror.KpiMirror(page, self.config.all_products) if mirror else None
+        self.recording = recording  # A recorder.Recorder to record this game's loop into, or None
+        self.state = state  # A state_store.StateStore to resume from and save progress to, or None
+        self.siblings = []  # The other sessions of the fleet, whose tabs a re-attach must not take over
+        self.url = page.url  # The game's state is filed under the URL it was first found at
+        self.stats = {"days": 0, "orders_placed": 0, "locations_skipped": 0, "locations_unchanged": 0,
+                      "service_handled": 0, "service_failed": 0, "reconnects": 0, "last_day": None, "status": "idle",
+                      "error": None, "started": None, "finished": None}
+
+    def log(self, msg, color="black"):
+        with botlog.context(session=self.name):
+            engine.print_log(msg, color)
+
+    async def run(self):
+        """
+        Runs this game's daily loop with its own configuration, until the game ends or the task is cancelled.
+        If the connection drops (or the tab goes away) mid-loop, the session re-attaches to its tab and resumes
+        from the game's current day, keeping its settings, stats and learned per-page state.
+        """
+        self.stats["status"] = "running"
+        self.stats["started"] = time.time()
+        try:
+            with game_api.use_config(self.config), recorder.use_recorder(self.recording, self.name), \
+                    tracing.use_session(self.name), botlog.context(session=self.name):
+                saved = self.state.get(self.url) if self.state else {}
+                if saved.get("product_set", self.config.product_set) != self.config.product_set:
+                    saved = {}  # Saved for another configuration of this game; start afresh
+                while True:
+                    try:
+                        await self._prepare_page(saved)
+                        resume_after_day = self.stats["last_day"] or saved.get("last_day")
+                        await engine.run_automation_loop(self.page, self.mode, lambda: self.settings, self.log,
+                                                         self.stats, resume_after_day, self._save_day)
+                        break
+                    except Exception as e:
+                        if not self._connection_lost():
+                            raise
+                        self.log(f"Connection to the tab lost ({e}). Re-attaching...", "red")
+                        await self._reattach()
+            self.stats["status"] = "finished"
+        except asyncio.CancelledError:
+            self.stats["status"] = "stopped"
+            raise
+        except Exception as e:
+            self.stats["status"] = "error"
+            self.stats["error"] = str(e)
+            self.log(f"AUTOMATION ERROR ({self.mode}): {e}", "red")
+        finally:
+            self.stats["finished"] = time.time()
+            if self.mirror:
+                await self.mirror.detach()
+            if self.lean:
+                await lean_mode.disable(self.page)
+
+    async def _prepare_page(self, saved):
+        await game_api.install_helpers(self.page)
+        if self.lean:
+            await lean_mode.enable(self.page)
+        if self.mirror:
+            await self.mirror.attach()
+        if not self.settings["locations"] and self.mode in ['retail', 'full']:
+            self.settings["locations"] = await game_api.get_owned_retail_locations(self.page)
+            if saved.get("locations") and saved["locations"] != self.settings["locations"]:
+                self.log(f"Owned locations changed since the last run: {saved['locations']} -> "
+                         f"{self.settings['locations']}", "orange")
+            self.log(f"Found owned locations: {self.settings['locations']}", "green")
+            if self.state:
+                self.state.update(self.url, locations=self.settings["locations"])
+
+    def _save_day(self, day):
+        if self.state:
+            self.state.update(self.url, product_set=self.config.product_set, location_set=self.config.location_set,
+                              mode=self.mode, last_day=day)
+
+    def _connection_lost(self):
+        return self.link is not None and (not self.link.connected or self.page.isClosed())
+
+    async def _reattach(self):
+        """Finds this game's tab again once the link is back up and moves the per-page state over to it."""
+        attempt = 0
+        while True:
+            try:
+                taken = {session.target_id for session in self.siblings if session.link is self.link}
+                target_id, page = await self.link.resolve(self.target_id, [self.host], timeout=REATTACH_TIMEOUT,
+                                                          exclude=taken)
+                break
+            except Exception as e:
+                attempt += 1
+                if attempt >= MAX_REATTACH_ATTEMPTS:
+                    raise Exception(f"Could not re-attach to the game's tab: {e}")
+                self.log(f"Re-attach attempt {attempt} failed: {e}", "red")
+                await asyncio.sleep(min(30, 2 ** attempt))
+        if self.mirror:
+            await self.mirror.detach()
+            self.mirror = kpi_mirror.KpiMirror(page, self.config.all_products)
+        game_api.adopt_page_state(self.page, page)
+        self.page, self.target_id = page, target_id
+        self.stats["reconnects"] += 1
+        self.log(f"Re-attached to {page.url}", "green")
+
+
+class Fleet:
+    """Drives a list of GameSessions side by side. One game failing does not stop the others."""
+
+    def __init__(self, sessions):
+        self.sessions = list(sessions)
+        for session in self.sessions:
+            session.siblings = [other for other in self.sessions if other is not session]
+
+    async def run(self):
+        """Runs every session's loop concurrently and returns once all of them have ended."""
+        _log.info("Starting fleet of %d game(s)...", len(self.sessions))
+        tasks = [asyncio.ensure_future(session.run()) for session in self.sessions]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            print(self.report())
+
+    def report(self):
+        """A per-session summary table of the fleet's stats."""
+        lines = [f"{'game':<40} {'status':<9} {'days':>5} {'orders':>7} {'skipped':>8} {'unchanged':>10} "
+                 f"{'service':>8} {'reconn':>7}"]
+        for session in self.sessions:
+            stats = session.stats
+            lines.append(f"{session.name[:40]:<40} {stats['status']:<9} {stats['days']:>5} {stats['orders_placed']:>7} "
+                         f"{stats['locations_skipped']:>8} {stats['locations_unchanged']:>10} "
+                         f"{stats['service_handled']:>8} {stats['reconnects']:>7}")
+            if stats["error"]:
+                lines.append(f"    error: {stats['error']}")
+        return "\n".join(lines)
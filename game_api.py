@@ -1,8 +1,23 @@
 # game_api.py
 # Your reusable library for all low-level game interactions.
 import asyncio
-import math
-import re
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import time
+import urllib.parse
+import weakref
+
+import botlog
+import kpi_mirror
+import planner
+import recorder
+import tracing
+from page_helpers import call_helper, install_helpers
+
+_log = botlog.get_logger("game_api")
 
 # --- Data Constants for Different Product Sets ---
 JUICE_SET = {
@@ -35,11 +50,9 @@ ELECTRONICS_SET = {
     "valid_order_quantities": [100, 300, 500, 800, 1200, 2000, 3000, 4000, 5000, 6000, 8000, 10000, 12000]
 }
 
-# --- Global State Variables (Product) ---
-PRODUCT_CODE_MAP = JUICE_SET["code_map"]
-PRODUCT_SPACE_USAGE = JUICE_SET["space_usage"]
-ALL_PRODUCTS = list(PRODUCT_CODE_MAP.keys())
-VALID_ORDER_QUANTITIES = JUICE_SET["valid_order_quantities"]
+PRODUCT_SETS = {"Juice": JUICE_SET, "Mask": MASK_SET, "Car": CAR_SET, "Coffee": COFFEE_SET,
+                "Electronics": ELECTRONICS_SET}
+
 
 # --- Hard-coded Location Maps ---
 INDONESIA_LOCATION_ID_MAP = {
@@ -52,56 +65,242 @@ CHINA_LOCATION_ID_MAP = {
     "Zhuhai": "15", "Dongguan": "16", "Shanghai": "17"
 }
 
+LOCATION_SETS = {"Indonesia": INDONESIA_LOCATION_ID_MAP, "China": CHINA_LOCATION_ID_MAP}
+
+
+# --- Per-Game Configuration ---
+class GameConfig:
+    """The product set and location set one game is played with, plus the lookup tables derived from them."""
+
+    def __init__(self, product_set="Juice", location_set="Indonesia"):
+        self.set_product_set(product_set)
+        self.set_location_set(location_set)
+
+    def set_product_set(self, set_name):
+        active_set = PRODUCT_SETS.get(set_name)
+        if active_set is None:
+            raise ValueError(f"Unknown product set: {set_name}")
+        self.product_set = set_name
+        self.product_code_map = active_set["code_map"]
+        self.product_space_usage = active_set["space_usage"]
+        self.all_products = list(self.product_code_map.keys())
+        self.valid_order_quantities = active_set["valid_order_quantities"]
+        self.catalog = planner.Catalog(active_set)
+
+    def set_location_set(self, set_name):
+        location_id_map = LOCATION_SETS.get(set_name)
+        if location_id_map is None:
+            raise ValueError(f"Unknown location set: {set_name}")
+        self.location_set = set_name
+        self.location_id_map = location_id_map
+
+
+# The configuration used outside of any game session (the GUI and the single-game runner)
+_DEFAULT_CONFIG = GameConfig()
+# The configuration of the game session running in the current asyncio task, if any
+_ACTIVE_CONFIG = contextvars.ContextVar("game_api_active_config", default=None)
+
+
+def active_config():
+    """Returns the GameConfig of the current game session, or the module-wide default outside of one."""
+    return _ACTIVE_CONFIG.get() or _DEFAULT_CONFIG
+
+
+@contextlib.contextmanager
+def use_config(config):
+    """Makes every game_api call inside the block (and in tasks it starts) use the given GameConfig."""
+    token = _ACTIVE_CONFIG.set(config)
+    try:
+        yield config
+    finally:
+        _ACTIVE_CONFIG.reset(token)
+
+
+# --- Global State Variables (Product) ---
+# Mirrors of the default configuration, kept for the GUI
+CURRENT_PRODUCT_SET = _DEFAULT_CONFIG.product_set  # Keep track of the name
+PRODUCT_CODE_MAP = _DEFAULT_CONFIG.product_code_map
+PRODUCT_SPACE_USAGE = _DEFAULT_CONFIG.product_space_usage
+ALL_PRODUCTS = _DEFAULT_CONFIG.all_products
+VALID_ORDER_QUANTITIES = _DEFAULT_CONFIG.valid_order_quantities
+
 # --- Global State Variables (Location) ---
-LOCATION_ID_MAP = INDONESIA_LOCATION_ID_MAP  # Default to Indonesia
-CURRENT_LOCATION_SET = "Indonesia"  # Keep track of the name
+LOCATION_ID_MAP = _DEFAULT_CONFIG.location_id_map  # Default to Indonesia
+CURRENT_LOCATION_SET = _DEFAULT_CONFIG.location_set  # Keep track of the name
 _alternating_buy_counter = 0
 
 
 # --- Function to Switch Product Sets ---
 def set_active_product_set(set_name):
-    """Switches the global constants to use the specified product set."""
-    global PRODUCT_CODE_MAP, PRODUCT_SPACE_USAGE, ALL_PRODUCTS, VALID_ORDER_QUANTITIES
-
-    if set_name == "Juice":
-        active_set = JUICE_SET
-    elif set_name == "Mask":
-        active_set = MASK_SET
-    elif set_name == "Car":
-        active_set = CAR_SET
-    elif set_name == "Coffee":
-        active_set = COFFEE_SET
-    elif set_name == "Electronics":
-        active_set = ELECTRONICS_SET
-    else:
-        raise ValueError(f"Unknown product set: {set_name}")
-
-    PRODUCT_CODE_MAP = active_set["code_map"]
-    PRODUCT_SPACE_USAGE = active_set["space_usage"]
-    ALL_PRODUCTS = list(PRODUCT_CODE_MAP.keys())
-    VALID_ORDER_QUANTITIES = active_set["valid_order_quantities"]
-    print(f"Product set switched to: {set_name}")
+    """Switches the default configuration (and the global constants) to the specified product set."""
+    global PRODUCT_CODE_MAP, PRODUCT_SPACE_USAGE, ALL_PRODUCTS, VALID_ORDER_QUANTITIES, CURRENT_PRODUCT_SET
+
+    _DEFAULT_CONFIG.set_product_set(set_name)
+    PRODUCT_CODE_MAP = _DEFAULT_CONFIG.product_code_map
+    PRODUCT_SPACE_USAGE = _DEFAULT_CONFIG.product_space_usage
+    ALL_PRODUCTS = _DEFAULT_CONFIG.all_products
+    VALID_ORDER_QUANTITIES = _DEFAULT_CONFIG.valid_order_quantities
+    CURRENT_PRODUCT_SET = set_name
+    _log.info("Product set switched to: %s", set_name)
     return ALL_PRODUCTS
 
 
 # --- Function to Switch Location Sets ---
 def set_active_location_set(set_name):
-    """Switches the global LOCATION_ID_MAP to the specified set."""
+    """Switches the default configuration (and the global LOCATION_ID_MAP) to the specified set."""
     global LOCATION_ID_MAP, CURRENT_LOCATION_SET
 
-    if set_name == "Indonesia":
-        LOCATION_ID_MAP = INDONESIA_LOCATION_ID_MAP
-    elif set_name == "China":
-        LOCATION_ID_MAP = CHINA_LOCATION_ID_MAP
-    else:
-        raise ValueError(f"Unknown location set: {set_name}")
-
+    _DEFAULT_CONFIG.set_location_set(set_name)
+    LOCATION_ID_MAP = _DEFAULT_CONFIG.location_id_map
     CURRENT_LOCATION_SET = set_name
-    print(f"Location set switched to: {set_name}")
+    _log.info("Location set switched to: %s", set_name)
     return True
 
 
+# --- Tracing ---
+def _trace_context():
+    config = active_config()
+    return {"product_set": config.product_set, "location_set": config.location_set}
+
+
+# Wraps a coroutine in a tracing span recording its location/selector and the active sets (free when disabled)
+_traced = tracing.traced(context=_trace_context)
+
+
+def _recorded(fn):
+    """Records each call of a UI action (its first argument, e.g. the selector) and its outcome, when recording."""
+    @functools.wraps(fn)
+    async def wrapper(page, *args, **kwargs):
+        start = time.perf_counter()
+        target = args[0] if args else None
+        try:
+            result = await fn(page, *args, **kwargs)
+        except Exception as e:
+            recorder.record("action", action=fn.__name__, target=target, ok=False, error=str(e),
+                            ms=round((time.perf_counter() - start) * 1000))
+            raise
+        recorder.record("action", action=fn.__name__, target=target, ok=result is not False,
+                        ms=round((time.perf_counter() - start) * 1000))
+        return result
+
+    return wrapper
+
+
+# --- Wait Engine ---
+# Per condition: how often it was waited for, how often it timed out, and the time spent waiting
+WAIT_STATS = {}
+
+
+async def _wait_until(page, condition, *args, timeout=10):
+    """
+    Waits in-page for a named readiness condition (see the conditions in page_helpers), checked on every
+    DOM mutation and animation frame, for at most timeout seconds (0: no limit).
+    Returns {ok, value, elapsedMs}; ok is False on a timeout. Every wait is counted in WAIT_STATS.
+    """
+    with tracing.span("wait", condition=condition, **_trace_context()) as wait_span:
+        result = await call_helper(page, 'waitFor', condition, list(args), int(timeout * 1000))
+        wait_span.set(outcome="ok" if result['ok'] else "timeout", waited_ms=result['elapsedMs'])
+    stats = WAIT_STATS.setdefault(condition, {"count": 0, "timeouts": 0, "total_ms": 0, "max_ms": 0})
+    stats["count"] += 1
+    stats["timeouts"] += 0 if result['ok'] else 1
+    stats["total_ms"] += result['elapsedMs']
+    stats["max_ms"] = max(stats["max_ms"], result['elapsedMs'])
+    return result
+
+
+def wait_stats_report():
+    """A per-condition summary table of WAIT_STATS."""
+    lines = [f"{'condition':<18} {'waits':>6} {'timeouts':>9} {'mean ms':>8} {'max ms':>7}"]
+    for condition, stats in sorted(WAIT_STATS.items()):
+        lines.append(f"{condition:<18} {stats['count']:>6} {stats['timeouts']:>9} "
+                     f"{stats['total_ms'] / stats['count']:>8.0f} {stats['max_ms']:>7}")
+    return "\n".join(lines)
+
+
+# --- Client-side Rate Limiter ---
+class RateLimiter:
+    """
+    Adaptive token bucket that paces UI actions to stay under the game's "Slow down" threshold.
+    The rate halves whenever a limit is hit and creeps back up after a run of clean actions.
+    """
+
+    def __init__(self, rate=4.0, burst=3, min_rate=0.5, max_rate=8.0, recovery_step=0.25, recovery_streak=20,
+                 penalty=1.5):
+        self.rate = rate  # Actions per second
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.recovery_step = recovery_step
+        self.recovery_streak = recovery_streak
+        self.penalty = penalty  # Seconds to stay quiet after a limit was hit
+        self.tokens = burst
+        self.actions = 0
+        self.limit_hits = 0
+        self._clean_streak = 0
+        self._last_refill = None
+        self._blocked_until = 0.0
+        self._lock = None
+
+    def _refill(self, now):
+        if self._last_refill is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        """Waits until the next UI action is allowed, then spends one token on it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_event_loop()
+            now = loop.time()
+            if now < self._blocked_until:
+                with tracing.span("rate_limiter_penalty", seconds=self._blocked_until - now):
+                    await asyncio.sleep(self._blocked_until - now)
+                now = loop.time()
+            self._refill(now)
+            if self.tokens < 1:
+                with tracing.span("rate_limiter_wait", rate=self.rate):
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill(loop.time())
+            self.tokens -= 1
+            self.actions += 1
+
+    def record_success(self):
+        """Called after a clean action; speeds back up after a long enough clean streak."""
+        self._clean_streak += 1
+        if self._clean_streak >= self.recovery_streak:
+            self._clean_streak = 0
+            self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+    def lift_penalty(self):
+        """Ends the quiet time after a limit hit early (the game has stopped showing its warning)."""
+        self._blocked_until = 0.0
+
+    def record_rate_limit(self):
+        """Called when the game told us to slow down: halve the rate and hold off for the penalty time."""
+        self.limit_hits += 1
+        self._clean_streak = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self._blocked_until = asyncio.get_event_loop().time() + self.penalty
+        recorder.record("rate_limit", hits=self.limit_hits, rate=self.rate)
+        _log.warning("Rate limit hit #%d. Slowing down to %.2f actions/s.", self.limit_hits, self.rate)
+
+
+# One limiter per game page, since the limit is enforced per game session
+_RATE_LIMITERS = weakref.WeakKeyDictionary()
+
+
+def get_rate_limiter(page):
+    """Returns the RateLimiter pacing the UI actions on this page, creating it on first use."""
+    limiter = _RATE_LIMITERS.get(page)
+    if limiter is None:
+        limiter = _RATE_LIMITERS[page] = RateLimiter()
+    return limiter
+
+
 # --- Core Interaction Primitives ---
+@_traced
 async def find_element(page, selector, selector_type='css', timeout=5000):
     """Finds a single element and returns its handle, waiting for it to appear first."""
     try:
@@ -117,36 +316,97 @@ async def find_element(page, selector, selector_type='css', timeout=5000):
         raise Exception(f"Could not find element with {selector_type} selector '{selector}': {e}")
 
 
+@_traced
+@_recorded
 async def click_element(page, selector, selector_type='css'):
     """Finds an element and performs a standard (simulated) click."""
     element = await find_element(page, selector, selector_type)
     if not element: raise Exception(f"Element handle not found for click: {selector}")
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
     await element.click()
+    limiter.record_success()
 
 
+@_traced
+@_recorded
 async def js_click_element(page, selector, selector_type='css'):
     """Finds an element and triggers a click programmatically using JavaScript."""
-    print(f"Attempting programmatic JS click on: {selector}")
+    _log.debug("Attempting programmatic JS click on: %s", selector)
+    if selector_type not in ('css', 'xpath'):
+        raise ValueError("selector_type must be 'css' or 'xpath'")
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
     try:
-        if selector_type == 'css':
-            await page.waitForSelector(selector, timeout=5000)
-            await page.evaluate(f'document.querySelector("{selector}").click()')
-        elif selector_type == 'xpath':
-            await page.waitForXPath(selector, timeout=5000)
-            await page.evaluate(
-                f'document.evaluate("{selector}", document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue.click()')
-        else:
-            raise ValueError("selector_type must be 'css' or 'xpath'")
+        clicked = await call_helper(page, 'click', selector, selector_type, 5000)
     except Exception as e:
         raise Exception(f"Failed programmatic JS click on {selector_type} selector '{selector}': {e}")
+    if not clicked:
+        raise Exception(f"Failed programmatic JS click on {selector_type} selector '{selector}': element not found")
+    limiter.record_success()
+
+
+@_traced
+@_recorded
+async def click_link(page, href):
+    """Clicks a link by its exact href (as read from the page), without building a selector out of it."""
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
+    if not await call_helper(page, 'clickLink', href):
+        raise Exception(f"No link with href '{href}' on the page.")
+    limiter.record_success()
+
+
+@_traced
+@_recorded
+async def select_option(page, selector, value):
+    """Selects an option in a <select> element, paced by the page's rate limiter."""
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
+    try:
+        await page.select(selector, value)
+    except Exception as e:
+        raise Exception(f"Could not select '{value}' in '{selector}': {e}")
+    limiter.record_success()
+
+
+@_traced
+@_recorded
+async def fill_form(page, values):
+    """Sets several <select> elements ({selector: option_value}) in one in-page call, paced as one UI action."""
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
+    failed = await call_helper(page, 'fillForm', values)
+    if failed:
+        raise Exception(f"Could not fill form fields: {failed}")
+    limiter.record_success()
+
+
+@_traced
+async def _wait_for_dialog_open(page, timeout=30):
+    """Waits for the facebox dialog's submit button to show."""
+    if not (await _wait_until(page, 'dialogOpen', timeout=timeout))['ok']:
+        raise Exception(f"Dialog did not open within {timeout}s.")
+
+
+@_traced
+async def _wait_for_dialog_closed(page, timeout=30):
+    """Waits for the facebox dialog to close after a submit."""
+    if not (await _wait_until(page, 'dialogClosed', timeout=timeout))['ok']:
+        raise Exception(f"Dialog did not close within {timeout}s.")
 
 
 # --- NEW: Rate Limit Helper ---
+@_traced
 async def _check_for_rate_limit(page):
-    """Checks for the 'Slow down' message and returns True if found."""
+    """Checks for the 'Slow down' message and returns True if found. A hit also slows down the page's rate limiter."""
     try:
-        content = await page.evaluate("document.body.textContent")
-        if "Slow down, you click too fast" in content:
+        if await call_helper(page, 'rateLimitProbe'):
+            limiter = get_rate_limiter(page)
+            limiter.record_rate_limit()
+            # Hold off only until the banner is gone, if that is sooner than the limiter's penalty time
+            if (await _wait_until(page, 'rateLimitCleared', timeout=limiter.penalty))['ok']:
+                limiter.lift_penalty()
             return True
     except Exception:
         pass  # Page might be navigating, etc.
@@ -154,294 +414,663 @@ async def _check_for_rate_limit(page):
 
 
 # --- Automation Core Functions ---
+def _live_mirror(page):
+    """The page's attached KPI mirror (see kpi_mirror.py), if it is current and tracks the active product set."""
+    mirror = kpi_mirror.get_mirror(page)
+    if mirror is not None and mirror.ready and mirror.products == active_config().all_products:
+        return mirror
+    return None
+
+
+def _parse_day_text(day_text):
+    """Parses the '12 / 30' text of the day counter."""
+    current_day, total_days = map(int, day_text.split(' / '))
+    return {"current": current_day, "total": total_days}
+
+
+@_traced
 async def get_current_day(page):
     """Reads the current day from the top bar."""
     try:
-        day_text = await page.evaluate("document.querySelector('#KPI_DAY____').textContent")
-        current_day, total_days = map(int, day_text.split(' / '))
-        return {"current": current_day, "total": total_days}
+        mirror = _live_mirror(page)
+        day_text = mirror.day_text if mirror else await call_helper(page, 'readDay')
+        return _parse_day_text(day_text)
     except Exception as e:
         raise Exception(f"Could not parse current day: {e}")
 
 
-async def wait_for_next_day(page, current_day_num):
-    """Intelligently waits for the day counter to change."""
-    print(f"Waiting for day to advance past {current_day_num}...")
-    for _ in range(45):  # Timeout after ~45 seconds
-        day_info = await get_current_day(page)
-        if day_info["current"] > current_day_num:
-            print(f"New day detected: {day_info['current']}")
-            return day_info
-        await asyncio.sleep(1)
-    raise Exception("Timeout: Day did not advance.")
+# What a wait interrupted by a navigation fails with (anything else, e.g. a dropped connection, is raised)
+_NAVIGATION_ERRORS = ("Execution context was destroyed", "Cannot find context with specified id")
+_MAX_NAVIGATION_RETRIES = 25  # In a row, 0.2s apart
+
+
+@_traced
+async def wait_for_next_day(page, current_day_num, timeout=45):
+    """
+    Waits for the day counter to move past current_day_num and returns the new day info.
+    The wait happens in-page on the wait engine's dayChanged condition, so the new day is seen within milliseconds.
+    A timeout of 0 waits forever.
+    """
+    _log.debug("Waiting for day to advance past %s...", current_day_num)
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout if timeout else None
+    navigation_retries = 0
+    while True:
+        remaining_ms = int((deadline - loop.time()) * 1000) if deadline else 0
+        if deadline and remaining_ms <= 0:
+            raise Exception("Timeout: Day did not advance.")
+        try:
+            day_text = (await _wait_until(page, 'dayChanged', current_day_num, timeout=remaining_ms / 1000))['value']
+        except Exception as e:
+            if page.isClosed(): raise Exception(f"Page closed while waiting for the next day: {e}")
+            # A navigation destroys the execution context mid-wait; wait again in the new document
+            if not any(message in str(e) for message in _NAVIGATION_ERRORS):
+                raise
+            navigation_retries += 1
+            if navigation_retries > _MAX_NAVIGATION_RETRIES:
+                raise Exception(f"Day watcher kept being interrupted by navigations: {e}")
+            _log.warning("Day watcher interrupted (%s). Re-attaching...", e)
+            await asyncio.sleep(0.2)
+            continue
+        if day_text is None:
+            raise Exception("Timeout: Day did not advance.")
+        day_info = _parse_day_text(day_text)
+        _log.info("New day detected: %s", day_info['current'])
+        return day_info
+
+
+async def iter_day_changes(page, timeout=0):
+    """
+    Async iterator over day-change events, yielding the new day info each time the counter rolls over.
+    Stops after the last day of the game.
+        async for day_info in game_api.iter_day_changes(page): ...
+    """
+    day_info = await get_current_day(page)
+    while day_info["current"] < day_info["total"]:
+        day_info = await wait_for_next_day(page, day_info["current"], timeout)
+        yield day_info
 
 
 # --- Service / HR Module ---
-async def handle_service_requests(page):
-    """MODIFIED: Navigates to Service and handles the first available request, with retries."""
+SERVICE_TABS = ["Marketing Srv", "Franchise Srv", "Technical Srv"]  # In the order their mandays are listed
+
 
+async def _handle_one_service_request(page, request):
+    """Opens one request from the incoming list, staffs all tabs in one in-page call and submits it."""
     for attempt in range(3):  # Try up to 3 times
-        try:
-            print("Checking for service requests...")
+        with tracing.span("service_attempt", attempt=attempt + 1, request=request['label'],
+                          **_trace_context()) as attempt_span:
             try:
-                await click_element(page, '#boxmodsrv')
-                await click_element(page, '#MENU2_SRVincm')
-                await asyncio.sleep(1)
-            except:
-                return "Service module not found or enabled. Skipping."
+                # A retry after the dialog opened carries on in it instead of opening the request again
+                if attempt == 0 or not await call_helper(page, 'dialogOpen'):
+                    await click_link(page, request['href'])
+                    await _wait_for_dialog_open(page)
+
+                await get_rate_limiter(page).acquire()  # The allocation clicks several staff buttons
+                allocation = await call_helper(page, 'allocateServiceStaff', SERVICE_TABS)
+                mandays, assigned = allocation['mandays'], allocation['assigned']
+                _log.debug("%s: assigned staff %s for mandays %s", request['label'], assigned, mandays)
+
+                await _wait_until(page, 'submitReady', timeout=2)
+                await click_element(page, '#facebox #submit_button')
+                await _wait_for_dialog_closed(page)
+
+                if any(a < m for a, m in zip(assigned, mandays)):
+                    attempt_span.set(outcome="short_staffed")
+                    return f"Submitted without enough free staff (needed {mandays}, assigned {assigned})."
+                return "Service request handled successfully."  # Success, break the retry loop
+
+            except Exception as e:
+                _log.warning("Service request attempt %d failed: %s", attempt + 1, e)
+                attempt_span.set(outcome=f"error: {e}")
+                if await _check_for_rate_limit(page):
+                    attempt_span.set(outcome="rate_limited")
+                    _log.info("Rate limit detected. Retrying once the rate limiter allows...")
+                    continue  # Go to the next attempt; the limiter holds the next action back
+                else:
+                    return f"Service request failed: {e}"  # Real error, don't retry
 
-            try:
-                request_link = await find_element(page, "a[href*='cmd=SRV_INCOMING']", 'css', timeout=2000)
-                await request_link.click()
-                await page.waitForSelector('#facebox #submit_button', {'visible': True})
-                print("Opened service request. Analyzing mandays...")
-            except:
-                return "No new service requests found."
-
-            force_open_tab_js = """
-            function forceOpenTab(tabName) {
-                let tabs = document.querySelectorAll(".ui-tabs-tab");
-                tabs.forEach(tab => tab.classList.remove('ui-tabs-active', 'ui-state-active'));
-                let selectedTab = [...tabs].find(tab => tab.textContent.includes(tabName));
-                if (selectedTab) {
-                    selectedTab.classList.add('ui-tabs-active', 'ui-state-active');
-                    let panelId = selectedTab.querySelector("a").getAttribute("href");
-                    document.querySelectorAll(".ui-tabs-panel").forEach(p => p.style.display = 'none');
-                    document.querySelector(panelId).style.display = 'block';
-                }
-            }"""
-            await page.evaluate(force_open_tab_js)
-
-            click_buttons_js = """
-            function clickButtonsForTab(tabName, requiredClicks) {
-                forceOpenTab(tabName); 
-                return new Promise(resolve => setTimeout(() => {
-                    let tabId = jQuery('.ui-tabs-tab').filter(function() { return jQuery(this).text().trim() === tabName; }).attr('aria-controls');
-                    if (!tabId) return resolve();
-                    let buttons = jQuery('#' + tabId).find('.circle.thecb').not('.disabled').slice(0, requiredClicks);
-                    buttons.each(function() { jQuery(this).trigger('click'); });
-                    resolve();
-                }, 300));
-            }"""
-            await page.evaluate(click_buttons_js)
-
-            mandays = await page.evaluate('''
-                () => {
-                    const elements = document.querySelectorAll('.col-md-5');
-                    const mandays = [];
-                    elements.forEach(element => {
-                        const match = element.textContent.match(/Required Mandays\\s*:\\s*(\\d+)/);
-                        if (match) mandays.push(parseInt(match[1]));
-                    });
-                    return mandays;
-                }
-            ''')
-
-            if mandays:
-                if mandays[0] > 0: await page.evaluate(
-                    f"clickButtonsForTab('Marketing Srv', {mandays[0]})"); await asyncio.sleep(0.3)
-                if len(mandays) > 1 and mandays[1] > 0: await page.evaluate(
-                    f"clickButtonsForTab('Franchise Srv', {mandays[1]})"); await asyncio.sleep(0.3)
-                if len(mandays) > 2 and mandays[2] > 0: await page.evaluate(
-                    f"clickButtonsForTab('Technical Srv', {mandays[2]})")
-                print(f"Assigned staff for mandays: {mandays}")
-
-            await asyncio.sleep(0.5)
-            await click_element(page, '#facebox #submit_button')
-            await page.waitForSelector('#facebox', {'hidden': True})
-
-            return "Service request handled successfully."  # Success, break the retry loop
+    return "Service request failed after 3 attempts."
 
-        except Exception as e:
-            print(f"Service request attempt {attempt + 1} failed: {e}")
-            if await _check_for_rate_limit(page):
-                print("Rate limit detected. Waiting 1.5s and retrying...")
-                await asyncio.sleep(1.5)
-                continue  # Go to the next attempt
-            else:
-                return f"Service request failed: {e}"  # Real error, don't retry
 
-    return "Service request failed after 3 attempts."
+@_traced
+async def process_service_requests(page, max_requests=20):
+    """
+    Opens the incoming service list once and works through every pending request in it, without
+    re-navigating the menu in between. Stops early once staff runs out.
+    Returns a list of (request label, result message) pairs; raises if the Service module is not available.
+    """
+    _log.debug("Checking for service requests...")
+    try:
+        # The previous pass's list may still be showing; tag it so the wait holds out for the re-rendered one
+        await call_helper(page, 'markStale', "a[href*='cmd=SRV_INCOMING']")
+        await click_element(page, '#boxmodsrv')
+        await click_element(page, '#MENU2_SRVincm')
+        list_ready = (await _wait_until(page, 'serviceListReady', 700, timeout=3))['ok']
+    except Exception:
+        raise Exception("Service module not found or enabled.")
+    if not list_ready:
+        _log.warning("The incoming service list did not refresh within 3s. Using the list shown.")
+
+    requests = (await call_helper(page, 'serviceRequestLinks'))[:max_requests]
+    _log.info("Found %d pending service request(s).", len(requests))
+    results = []
+    for request in requests:
+        result = await _handle_one_service_request(page, request)
+        results.append((request['label'], result))
+        if result.startswith("Submitted without enough free staff"):
+            break  # The remaining requests would not get staff either
+    return results
+
+
+@_traced
+async def handle_service_requests(page):
+    """MODIFIED: Navigates to Service and handles every pending request. Returns a one-line summary."""
+    try:
+        results = await process_service_requests(page)
+    except Exception as e:
+        if "Service module not found" in str(e):
+            return "Service module not found or enabled. Skipping."
+        return f"Service request failed: {e}"
+    if not results:
+        return "No new service requests found."
+    handled = sum(1 for _, result in results if result.startswith("Service request handled"))
+    failures = "; ".join(f"{label}: {result}" for label, result in results
+                         if not result.startswith("Service request handled"))
+    return f"Handled {handled} of {len(results)} service request(s)." + (f" {failures}" if failures else "")
 
 
 # --- Retail Module ---
+@_traced
 async def get_retail_space_info(page, location_name):
     """Reads the space utilization from the Retail KPI panel."""
-    print(f"Reading space info for {location_name}...")
+    _log.debug("Reading space info for %s...", location_name)
     try:
-        space_info_xpath = f"//div[@id='RTL']//div[contains(., '{location_name}')]/following-sibling::li[contains(., 'Space utilization')]//div"
-        space_element = await find_element(page, space_info_xpath, 'xpath')
-        full_text = await page.evaluate('(element) => element.textContent', space_element)
-        match = re.search(r'([\d,]+)\s*/\s*([\d,]+)', full_text)
-        if not match: raise Exception(f"Could not parse space usage from: '{full_text}'")
-        used_m2 = int(match.group(1).replace(',', ''))
-        total_m2 = int(match.group(2).replace(',', ''))
-        return {'used_m2': used_m2, 'total_m2': total_m2}
+        location_info = _get_location_from_snapshot(await get_retail_snapshot(page), location_name)
+        return {'used_m2': location_info['used_m2'], 'total_m2': location_info['total_m2']}
     except Exception as e:
         raise Exception(f"Could not read space info for '{location_name}': {e}")
 
 
+@_traced
 async def get_owned_retail_locations(page):
     """Scrapes the Retail KPI panel for owned retail location names."""
-    print("Scraping for owned retail locations...")
+    mirror = _live_mirror(page)
+    if mirror:
+        return list(mirror.locations)
+    _log.debug("Scraping for owned retail locations...")
     try:
-        return await page.evaluate('''
-            () => Array.from(document.querySelectorAll("#RTL .kpi_title"))
-                        .map(el => el.textContent.replace("Retail", "").replace(/\u00A0/g, ' ').trim())
-        ''')
+        return await call_helper(page, 'ownedRetailLocations')
     except Exception as e:
         raise Exception(f"Could not scrape owned retail locations: {e}")
 
 
+@_traced
 async def get_all_retail_stock(page, location_name):
     """Reads the current stock levels for all products in a specific retail location."""
-    print(f"Reading all stock levels for {location_name}...")
-    stock = {}
+    _log.debug("Reading all stock levels for %s...", location_name)
     try:
-        location_kpi_xpath = f"//div[@id='RTL']//div[contains(@class, 'kpi_title') and contains(., '{location_name}')]"
-        for product_name in ALL_PRODUCTS:
-            stock_xpath = f"{location_kpi_xpath}/following-sibling::li[contains(., '{product_name}')]/span[@class='right']"
-            stock_element = await find_element(page, stock_xpath, 'xpath')
-            stock_text = await page.evaluate('(element) => element.textContent', stock_element)
-            stock[product_name] = int(stock_text.replace(',', ''))
-        print(f"Current stock: {stock}")
+        stock = _get_location_from_snapshot(await get_retail_snapshot(page), location_name)['stock']
+        _log.debug("Current stock: %s", stock)
         return stock
     except Exception as e:
         raise Exception(f"Could not read all stock for '{location_name}': {e}")
 
 
-def _calculate_best_fit_quantity(available_space, space_per_unit):
-    """Calculates the largest valid order size that fits in the available space."""
-    if available_space <= 0 or space_per_unit <= 0: return 0
-    max_units_possible = math.floor(available_space / space_per_unit)
-    if max_units_possible == 0: return 0
-    for qty in sorted(VALID_ORDER_QUANTITIES, reverse=True):
-        if qty <= max_units_possible: return qty
-    return 0
+@_traced
+async def get_retail_snapshot(page):
+    """
+    Reads every owned location's space and stock from the Retail KPI panel in a single evaluate
+    (or from the page's KPI mirror, if one is attached).
+    Returns a dictionary keyed by location name, e.g.
+    {"Jakarta": {"used_m2": 120, "total_m2": 500, "stock": {"Apple Juice": 3000, ...}}, ...}
+    """
+    mirror = _live_mirror(page)
+    if mirror:
+        return mirror.snapshot()
+    _log.debug("Reading retail KPI snapshot...")
+    try:
+        return await call_helper(page, 'retailSnapshot', active_config().all_products)
+    except Exception as e:
+        raise Exception(f"Could not read retail KPI snapshot: {e}")
 
 
-async def _calculate_order_logic(page, location_name, prioritized_products, target_fill_percentage):
+def _get_location_from_snapshot(snapshot, location_name):
+    """Pulls one location's space and stock out of a snapshot, validating that everything was found."""
+    entry = snapshot.get(location_name)
+    if entry is None:
+        raise Exception(f"Location '{location_name}' not found in the Retail KPI panel.")
+    if entry['used_m2'] is None or entry['total_m2'] is None:
+        raise Exception(f"Could not read space info for '{location_name}'.")
+    missing = [p for p in active_config().all_products if entry['stock'].get(p) is None]
+    if missing:
+        raise Exception(f"Could not read stock of {missing} for '{location_name}'.")
+    return entry
+
+
+@_traced
+async def _calculate_order_logic(page, location_name, prioritized_products, target_fill_percentage, snapshot=None):
     """
     Internal function that performs all the calculation logic for replenishment.
     This is shared by both the "dry run" calculator and the real procurement function.
+    If no snapshot from get_retail_snapshot is given, a fresh one is read.
     Returns a dictionary of orders to place, e.g. {"Apple Juice": 12000, "Melon Juice": 8000}
     """
-    print(
-        f"Calculating replenishment for '{location_name}' to {target_fill_percentage}%. Prioritizing: {prioritized_products or 'None'}")
+    _log.debug("Calculating replenishment for '%s' to %s%%. Prioritizing: %s", location_name, target_fill_percentage,
+               prioritized_products or 'None')
 
     # 1. Gather all required data
-    space_info = await get_retail_space_info(page, location_name)
-    current_used_m2 = space_info['used_m2']
-    total_m2 = space_info['total_m2']
-    current_stock = await get_all_retail_stock(page, location_name)
-
-    # 2. Calculate target space and individual product quotas
-    target_space_to_use = total_m2 * (target_fill_percentage / 100.0)
-    product_quotas = {}
-
-    if prioritized_products:
-        non_prioritized_products = [p for p in ALL_PRODUCTS if p not in prioritized_products]
-        prio_quota = (target_space_to_use * 0.60) / len(prioritized_products) if prioritized_products else 0
-        non_prio_quota = (target_space_to_use * 0.40) / len(
-            non_prioritized_products) if non_prioritized_products else 0
-        for p in prioritized_products: product_quotas[p] = prio_quota
-        for p in non_prioritized_products: product_quotas[p] = non_prio_quota
-    else:
-        quota_per_product = target_space_to_use / len(ALL_PRODUCTS)
-        for p in ALL_PRODUCTS: product_quotas[p] = quota_per_product
-
-    # 3. Calculate orders for each product independently
-    orders_to_place = {}
-    for product in ALL_PRODUCTS:
-        quota = product_quotas.get(product, 0)
-        current_space = current_stock.get(product, 0) * PRODUCT_SPACE_USAGE.get(product, 0.01)
-        space_to_fill = quota - current_space
-        if space_to_fill > 0:
-            qty = _calculate_best_fit_quantity(space_to_fill, PRODUCT_SPACE_USAGE[product])
-            if qty > 0:
-                orders_to_place[product] = qty
-                print(f"Rule: '{product}' needs to fill {space_to_fill:.2f}m². Ordering {qty}.")
-
-    # 4. Final Safety Check against physical remaining space
-    planned_order_space = sum(q * PRODUCT_SPACE_USAGE.get(p, 0) for p, q in orders_to_place.items())
-    physical_remaining_space = total_m2 - current_used_m2
-
-    if planned_order_space > physical_remaining_space:
-        print("WARNING: Target fill exceeds physical space. Scaling back orders...")
-        scaled_orders = {}
-        temp_remaining_space = physical_remaining_space
-        sorted_orders = sorted(orders_to_place.items(), key=lambda i: i[1] * PRODUCT_SPACE_USAGE[i[0]],
-                               reverse=True)
-        for product, qty in sorted_orders:
-            new_qty = _calculate_best_fit_quantity(temp_remaining_space, PRODUCT_SPACE_USAGE[product])
-            if new_qty > 0:
-                scaled_orders[product] = new_qty
-                temp_remaining_space -= new_qty * PRODUCT_SPACE_USAGE[product]
-        orders_to_place = scaled_orders
-
+    catalog = active_config().catalog
+    if snapshot is None:
+        snapshot = await get_retail_snapshot(page)
+    location_info = _get_location_from_snapshot(snapshot, location_name)
+    current_used_m2 = location_info['used_m2']
+    total_m2 = location_info['total_m2']
+    current_stock = location_info['stock']
+    _log.debug("Current stock: %s", current_stock)
+
+    # 2-4. Quotas by priority, the largest lot within each product's quota, scaled back to the physical space
+    quotas = planner.product_quotas(total_m2 * (target_fill_percentage / 100.0), catalog.products,
+                                    prioritized_products)
+    space_to_fill = planner.space_to_fill(current_stock, quotas, catalog)
+    orders_to_place, scaled_back = planner.orders_from_gaps(space_to_fill, total_m2 - current_used_m2, catalog,
+                                                            prioritized_products or [])
+    if _log.isEnabledFor(logging.DEBUG):
+        for product, qty in orders_to_place.items():
+            _log.debug("Rule: '%s' needs to fill %.2fm². Ordering %s.", product, space_to_fill[product], qty)
+    if scaled_back:
+        _log.warning("Target fill exceeded physical space. Re-planned orders to fit.")
+
+    recorder.record("plan", location=location_name, priorities=list(prioritized_products or []),
+                    fill=target_fill_percentage, kpi=location_info, orders=orders_to_place)
     return orders_to_place
 
 
-async def calculate_replenish_order(page, location_name, prioritized_products, target_fill_percentage=100):
+@_traced
+async def calculate_replenish_order(page, location_name, prioritized_products, target_fill_percentage=100,
+                                    snapshot=None):
     """
     Public function for the GUI to call.
     Performs a "dry run" calculation without clicking any buy buttons.
     Returns the dictionary of orders.
     """
     try:
-        orders = await _calculate_order_logic(page, location_name, prioritized_products, target_fill_percentage)
+        orders = await _calculate_order_logic(page, location_name, prioritized_products, target_fill_percentage,
+                                              snapshot)
         return orders
     except Exception as e:
-        print(f"Error during calculation for {location_name}: {e}")
+        _log.error("Error during calculation for %s: %s", location_name, e)
         raise Exception(f"Calculation failed for {location_name}: {e}")  # Re-raise to be caught by GUI
 
 
+# --- Per-location State Cache ---
+# Per page: location name -> the KPI state and plan inputs of the last pass that settled it (ordered or no order needed)
+_LOCATION_STATES = weakref.WeakKeyDictionary()
+
+
+def _location_state_key(location_info, prioritized_products, target_fill_percentage):
+    """Everything the plan for one location depends on: its space line, its stock and the plan inputs."""
+    config = active_config()
+    return (config.product_set, location_info['used_m2'], location_info['total_m2'],
+            tuple(location_info['stock'][p] for p in config.all_products),
+            tuple(prioritized_products or ()), target_fill_percentage)
+
+
+def forget_location_states(page):
+    """Drops the cached location states of a page, so every location is re-planned on the next pass."""
+    _LOCATION_STATES.pop(page, None)
+
+
+# --- Vendor Catalog ---
+# Per page: the vendor page as scraped on the current day, {"key": (day counter text, product set), "vendors": [...]}
+_VENDOR_CATALOGS = weakref.WeakKeyDictionary()
+DEFAULT_VENDOR = "VFG2"  # Ordered from when the catalog prices nothing (and no vendor is set)
+
+
+async def _show_vendor_page(page):
+    """Opens the retail vendor page and waits for it to list its vendors afresh."""
+    # Boxes from an earlier visit may still be showing; tag them so the wait holds out for the re-rendered ones
+    await call_helper(page, 'markStale', '.vendor-box')
+    await click_element(page, '#boxmodrtl')
+    await click_element(page, '#MENU2_retail_vendor')
+    if not (await _wait_until(page, 'vendorsListed', timeout=10))['ok']:
+        raise Exception("The vendor page did not list its vendors within 10s.")
+
+
+@_traced
+async def get_vendor_catalog(page, day_text=None, refresh=False):
+    """
+    The retail vendors, in page order, as [{"name", "href", "prices": {product: unit price}, "lead_time_days",
+    "info", "labels"}] (lead_time_days is None and prices are missing where the vendor page doesn't show them).
+    The vendor page is scraped in one evaluate the first time the catalog is asked for on a game day;
+    the rest of the day it comes from the cache. day_text is the day counter's text, if already read.
+    """
+    if day_text is None:
+        day_text = await call_helper(page, 'readDay')
+    config = active_config()
+    key = (day_text, config.product_set)
+    cached = _VENDOR_CATALOGS.get(page)
+    if cached is not None and cached['key'] == key and not refresh:
+        return cached['vendors']
+    _log.debug("Scraping the vendor page...")
+    await _show_vendor_page(page)
+    vendors = await call_helper(page, 'vendorCatalog', config.all_products)
+    _VENDOR_CATALOGS[page] = {"key": key, "vendors": vendors}
+    recorder.record("vendors", day=day_text, vendors=vendors)
+    _log.info("Vendor catalog for day %s: %s", day_text, ", ".join(v['name'] for v in vendors))
+    return vendors
+
+
+async def _pick_vendor(page, location_name, orders_to_place, day_text, max_lead_days=None):
+    """The catalog entry of the vendor to order this location's order from (see planner.choose_vendor)."""
+    vendors = await get_vendor_catalog(page, day_text)
+    vendor = planner.choose_vendor(vendors, orders_to_place, max_lead_days, DEFAULT_VENDOR)
+    if vendor is None:
+        raise Exception(f"No vendor delivers within {max_lead_days} day(s).")
+    cost = planner.order_cost(vendor, orders_to_place)
+    lead = vendor.get('lead_time_days')
+    _log.info("Ordering from %s (cost: %s, lead time: %s day(s)).", vendor['name'],
+              "unknown" if cost is None else f"${cost:,.2f}", "unknown" if lead is None else lead)
+    recorder.record("vendor", location=location_name, orders=orders_to_place, max_lead_days=max_lead_days,
+                    vendor=vendor['name'], cost=cost)
+    return vendor
+
+
+@_traced
+@_recorded
+async def _open_vendor_dialog(page, vendor_name, href=None):
+    """
+    Opens a vendor's order dialog through its BUY_FG link, found by the href from the vendor catalog (or by name).
+    The vendor page is only navigated to when it isn't showing already; the daily scrape and earlier orders leave it
+    open, so usually this is one click.
+    """
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
+    if not await call_helper(page, 'openVendor', vendor_name, href):
+        await _show_vendor_page(page)
+        await limiter.acquire()
+        if not await call_helper(page, 'openVendor', vendor_name, href):
+            raise Exception(f"Vendor '{vendor_name}' is not on the vendor page.")
+    limiter.record_success()
+    await _wait_for_dialog_open(page)
+
+
+# --- Direct Ordering ---
+# The vendor dialog's form POST, learned from a UI order, is replayed as one in-page fetch for later orders.
+# A replayed order only counts as placed if its response looks like the one the UI order got.
+# Per page: the last BUY_FG form POST seen, and the learned requests by vendor name
+_ORDER_REQUESTS = weakref.WeakKeyDictionary()
+_ORDER_TEMPLATES = weakref.WeakKeyDictionary()
+# Request headers worth replaying (the browser sets cookies, origin, length etc. itself)
+_REPLAYED_HEADERS = ('content-type', 'x-requested-with', 'x-csrf-token')
+RESPONSE_TIMEOUT = 5  # Seconds to wait for the body of a UI order's response when learning it
+
+
+def _watch_order_requests(page):
+    """
+    Starts recording the BUY_FG form POSTs the page sends, and the body of their responses, so a UI order can be
+    learned as a template.
+    """
+    if page in _ORDER_REQUESTS:
+        return
+    _ORDER_REQUESTS[page] = None
+
+    def on_request(request):
+        content_type = request.headers.get('content-type', '')
+        if request.method == 'POST' and 'BUY_FG' in request.url and 'x-www-form-urlencoded' in content_type:
+            _ORDER_REQUESTS[page] = {
+                "url": request.url,
+                "fields": dict(urllib.parse.parse_qsl(request.postData or '', keep_blank_values=True)),
+                "headers": {k: v for k, v in request.headers.items() if k.lower() in _REPLAYED_HEADERS},
+                "request": request,
+                "response": None,
+            }
+
+    def on_response(response):
+        seen = _ORDER_REQUESTS.get(page)
+        if seen is not None and response.request is seen['request']:
+            seen['response'] = asyncio.ensure_future(response.text())
+
+    page.on('request', on_request)
+    page.on('response', on_response)
+
+
+def _response_marker(text):
+    """
+    What a successful order's response looks like: the top-level keys of a JSON object,
+    otherwise the text without its numbers (which differ from order to order).
+    """
+    try:
+        body = json.loads(text)
+    except ValueError:
+        return {"text": " ".join("#" if any(c.isdigit() for c in word) else word for word in text.split())}
+    return {"json_keys": sorted(body) if isinstance(body, dict) else None}
+
+
+async def _learn_order_template(page, vendor_name):
+    """
+    Files the BUY_FG POST of the order just placed through the UI as this vendor's template, together with the
+    marker of its response. Nothing is learned if the response can't be read, since later orders couldn't be
+    confirmed.
+    """
+    seen = _ORDER_REQUESTS.get(page)
+    config = active_config()
+    if seen is None or 'destination_rtl' not in seen['fields']:
+        return
+    if not all(code in seen['fields'] for code in config.product_code_map.values()):
+        return
+    _ORDER_REQUESTS[page] = None
+    try:
+        text = await asyncio.wait_for(asyncio.shield(seen['response']), RESPONSE_TIMEOUT) if seen['response'] \
+            else None
+    except Exception as e:
+        _log.debug("Could not read the response of the UI order: %s", e)
+        text = None
+    if text is None:
+        _log.info("Could not read the response of the order to vendor %s. Not sending orders directly yet.",
+                  vendor_name)
+        return
+    _ORDER_TEMPLATES.setdefault(page, {})[vendor_name] = {
+        "url": seen['url'], "fields": seen['fields'], "headers": seen['headers'], "success": _response_marker(text)}
+    _log.info("Learned the order request for vendor %s. Later orders are sent directly.", vendor_name)
+
+
+def _order_succeeded(response, success_marker):
+    """
+    Judges the response of a replayed order: True if it looks like the learned UI order's response, False on a
+    clear failure (an error status, or a JSON body saying ok: false or carrying an error), and None otherwise,
+    since the order may or may not have been placed.
+    """
+    if not 200 <= response['status'] < 300:
+        return False
+    try:
+        body = json.loads(response['text'])
+    except ValueError:
+        body = None
+    if isinstance(body, dict) and (body.get('ok') is False or body.get('error')):
+        return False
+    return True if _response_marker(response['text']) == success_marker else None
+
+
+@_traced
+@_recorded
+async def _submit_order_directly(page, vendor_name, location_id, orders_to_place):
+    """
+    Places an order with one in-page POST built from the vendor's learned template.
+    Returns True once the response confirms the order, False if there is no template or the request clearly failed
+    (so the caller falls back to the UI), and None if it was sent but the response is not one the template knows:
+    then it must not be sent again.
+    """
+    template = _ORDER_TEMPLATES.get(page, {}).get(vendor_name)
+    if template is None:
+        return False
+    config = active_config()
+    fields = dict(template['fields'])
+    fields['destination_rtl'] = location_id
+    for product_name, product_code in config.product_code_map.items():
+        fields[product_code] = str(orders_to_place.get(product_name, 0))
+
+    limiter = get_rate_limiter(page)
+    await limiter.acquire()
+    response = await call_helper(page, 'postForm', template['url'], fields, template['headers'])
+    if 'Slow down' in response['text']:
+        limiter.record_rate_limit()
+        return False
+    succeeded = _order_succeeded(response, template['success'])
+    if not succeeded:
+        # The form or the game's answer may have changed; forget it so the next UI order re-learns it
+        _log.warning("Direct order %s (HTTP %s): %s. Using the UI instead.",
+                     "failed" if succeeded is False else "was not confirmed", response['status'],
+                     response['text'][:200])
+        _ORDER_TEMPLATES[page].pop(vendor_name, None)
+        return succeeded
+    limiter.record_success()
+    return True
+
+
+def adopt_page_state(old_page, new_page):
+    """
+    Moves what was learned about a game tab (its rate limiter, location states, order templates and vendor catalog)
+    to a new Page for the same tab, e.g. after re-attaching to it following a dropped connection.
+    """
+    for registry in (_RATE_LIMITERS, _LOCATION_STATES, _ORDER_TEMPLATES, _VENDOR_CATALOGS):
+        state = registry.pop(old_page, None)
+        if state is not None:
+            registry[new_page] = state
+
+
+@_traced
 async def procure_for_retail_location(page, location_name, prioritized_products, target_fill_percentage=100,
-                                      vendor_name="VFG2"):
+                                      vendor_name=None, snapshot=None, force=False, direct=False, max_lead_days=None):
     """
     MODIFIED: Handles replenishment with retries for rate limiting.
+    The first attempt plans from the given snapshot (if any). The planned order is kept across retries as long as
+    the day and the location's space line are unchanged, and a retry only redoes the UI steps that did not complete.
+    Locations whose stock, space and plan inputs are unchanged since the last settled pass are skipped
+    (e.g. an order is still on its way), unless force is set.
+    Without a vendor_name, each order goes to the vendor planner.choose_vendor picks from the day's vendor catalog
+    (cheapest for the order among those delivering within max_lead_days).
+    With direct set, the order is sent as one POST replaying the vendor form once a UI order has been learned;
+    the UI path is the fallback.
     """
+    location_states = _LOCATION_STATES.setdefault(page, {})
+    plan = None  # The order being placed, with the day and space line it was planned against
+    submitted = False
+    sent_directly = False  # A direct order went out (or may have), so it must not be sent again
     for attempt in range(3):  # Try up to 3 times
-        try:
-            # 1-4. Calculate the order
-            orders_to_place = await _calculate_order_logic(page, location_name, prioritized_products,
-                                                           target_fill_percentage)
-
-            if not orders_to_place:
-                return "Analysis complete. No order needed to meet targets."
-
-            # 5. Execute the order
-            print(f"Executing order for {location_name}: {orders_to_place}")
-            await click_element(page, '#boxmodrtl')
-            await click_element(page, '#MENU2_retail_vendor')
-            vendor_xpath = f"//div[contains(@class, 'vendor-box') and .//div[contains(text(), '{vendor_name}')]]//a[contains(@href, 'BUY_FG')]"
-            await js_click_element(page, vendor_xpath, 'xpath')
-            await page.waitForSelector('#facebox #submit_button', {'visible': True})
-
-            location_id = LOCATION_ID_MAP.get(location_name)
-            if not location_id:
-                raise Exception(
-                    f"Location '{location_name}' not found in the '{CURRENT_LOCATION_SET}' map. Check Global Settings.")
-
-            await page.select('#destination_rtl', location_id)
-            for product_name, quantity in orders_to_place.items():
-                product_code = PRODUCT_CODE_MAP.get(product_name)
-                if not product_code: continue
-                await page.select(f'#facebox #{product_code}', str(quantity))
-            await click_element(page, '#facebox #submit_button')
-            await page.waitForSelector('#facebox', {'hidden': True})
-            order_summary = ", ".join([f"{qty} of {prod}" for prod, qty in orders_to_place.items()])
-
-            return f"Successfully ordered: {order_summary} for {location_name}."  # Success, break retry loop
-
-        except Exception as e:
-            print(f"Procurement attempt {attempt + 1} failed: {e}")
-            if await _check_for_rate_limit(page):
-                print("Rate limit detected. Waiting 1.5s and retrying...")
-                await asyncio.sleep(1.5)
-                continue  # Go to the next attempt
-            else:
-                return f"SKIPPED {location_name}: Could not process replenishment. Reason: {e}"  # Real error
+        with tracing.span("procure_attempt", attempt=attempt + 1, location_name=location_name,
+                          **_trace_context()) as attempt_span:
+            try:
+                dialog_open, open_vendor = False, None
+                if sent_directly:
+                    attempt_span.set(outcome="direct_unconfirmed")
+                    return (f"SKIPPED {location_name}: The direct order may have been sent but was not confirmed. "
+                            f"Not sending it again.")
+                if plan is not None:
+                    # Retry: one cheap check instead of re-reading the whole KPI panel
+                    checkpoint = await call_helper(page, 'orderCheckpoint', location_name)
+                    dialog_open = checkpoint['dialogOpen']
+                    if submitted and not dialog_open:
+                        # The submit went through; only waiting for the dialog to close failed
+                        location_states[location_name] = plan['state_key']
+                        return f"Successfully ordered: {plan['summary']} for {location_name}."
+                    if (checkpoint['day'] != plan['day'] or checkpoint['used_m2'] != plan['used_m2']
+                            or checkpoint['total_m2'] != plan['total_m2']):
+                        _log.info("Day or space at %s changed since the order was planned. Re-planning...",
+                                  location_name)
+                        # The new order goes into the dialog already open, so it stays with that dialog's vendor
+                        open_vendor = plan['vendor'] if dialog_open else None
+                        plan, snapshot, submitted = None, None, False
+
+                if plan is None:
+                    # 1-4. Calculate the order, unless nothing it depends on has changed
+                    if snapshot is None:
+                        snapshot = await get_retail_snapshot(page)
+                    location_info = _get_location_from_snapshot(snapshot, location_name)
+                    state_key = _location_state_key(location_info, prioritized_products, target_fill_percentage)
+                    if not force and location_states.get(location_name) == state_key:
+                        attempt_span.set(outcome="unchanged")
+                        return (f"No change at {location_name} since the last pass (same stock, space and targets). "
+                                f"Skipping.")
+
+                    orders_to_place = await _calculate_order_logic(page, location_name, prioritized_products,
+                                                                   target_fill_percentage, snapshot)
+
+                    if not orders_to_place:
+                        location_states[location_name] = state_key
+                        attempt_span.set(outcome="no_order_needed")
+                        return "Analysis complete. No order needed to meet targets."
+
+                    day_text = await call_helper(page, 'readDay')
+                    if vendor_name:
+                        vendor = {"name": vendor_name, "href": None}
+                    elif open_vendor:
+                        vendor = open_vendor
+                    else:
+                        vendor = await _pick_vendor(page, location_name, orders_to_place, day_text, max_lead_days)
+                    plan = {
+                        "orders": orders_to_place,
+                        "vendor": vendor,
+                        "state_key": state_key,
+                        "summary": ", ".join([f"{qty} of {prod}" for prod, qty in orders_to_place.items()]),
+                        "day": day_text,
+                        "used_m2": location_info['used_m2'],
+                        "total_m2": location_info['total_m2'],
+                    }
+                else:
+                    attempt_span.set(reused_plan=True)
+
+                # 5. Execute the order
+                orders_to_place, vendor = plan['orders'], plan['vendor']
+                config = active_config()
+                location_id = config.location_id_map.get(location_name)
+                if not location_id:
+                    raise Exception(f"Location '{location_name}' not found in the '{config.location_set}' map. "
+                                    f"Check Global Settings.")
+
+                _log.info("Executing order for %s: %s", location_name, orders_to_place)
+                if direct and not dialog_open and not submitted:
+                    sent_directly = True  # Before the call: it may fail after the request went out
+                    placed = await _submit_order_directly(page, vendor['name'], location_id, orders_to_place)
+                    if placed:
+                        location_states[location_name] = plan['state_key']
+                        return f"Successfully ordered: {plan['summary']} for {location_name} (direct)."
+                    if placed is None:
+                        # Not settled, so the location is planned again on the next pass
+                        return (f"SKIPPED {location_name}: The direct order was sent but its response did not "
+                                f"confirm it. Not sending it again.")
+                    sent_directly = False
+                    _watch_order_requests(page)
+
+                if not dialog_open:
+                    await _open_vendor_dialog(page, vendor['name'], vendor['href'])
+
+                form_values = {'#destination_rtl': location_id}
+                for product_name, quantity in orders_to_place.items():
+                    product_code = config.product_code_map.get(product_name)
+                    if not product_code: continue
+                    form_values[f'#facebox #{product_code}'] = str(quantity)
+                await fill_form(page, form_values)
+                await click_element(page, '#facebox #submit_button')
+                submitted = True
+                await _wait_for_dialog_closed(page)
+                location_states[location_name] = plan['state_key']
+                if direct:
+                    await _learn_order_template(page, vendor['name'])
+
+                return f"Successfully ordered: {plan['summary']} for {location_name}."  # Success, break retry loop
+
+            except Exception as e:
+                _log.warning("Procurement attempt %d failed: %s", attempt + 1, e)
+                attempt_span.set(outcome=f"error: {e}")
+                if plan is None:
+                    snapshot = None  # Planning failed, so re-read the page on the next attempt
+                if await _check_for_rate_limit(page):
+                    attempt_span.set(outcome="rate_limited")
+                    _log.info("Rate limit detected. Retrying once the rate limiter allows...")
+                    continue  # Go to the next attempt; the limiter holds the next action back
+                else:
+                    return f"SKIPPED {location_name}: Could not process replenishment. Reason: {e}"  # Real error
 
     return f"SKIPPED {location_name}: Failed to process replenishment after 3 attempts."
 
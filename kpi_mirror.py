@@ -0,0 +1,156 @@
+# kpi_mirror.py
+# A live, in-memory copy of a game page's day counter and Retail KPI panel.
+# An in-page MutationObserver (page_helpers watchKpi) pushes only what changed through an exposed binding,
+# so reads are local lookups instead of CDP round-trips. game_api reads from a page's mirror while one is attached.
+import asyncio
+import time
+import weakref
+
+import botlog
+from page_helpers import call_helper
+
+_log = botlog.get_logger("kpi_mirror")
+
+BINDING_NAME = "__msbotKpiPush"
+
+# Per page: the attached mirror, and whether the push binding has been exposed (it cannot be removed again)
+_MIRRORS = weakref.WeakKeyDictionary()
+_BOUND_PAGES = weakref.WeakSet()
+
+
+class LocationKpi:
+    """One retail location's line in the KPI panel."""
+    __slots__ = ("used_m2", "total_m2", "stock")
+
+    def __init__(self, used_m2, total_m2, stock):
+        self.used_m2 = used_m2
+        self.total_m2 = total_m2
+        self.stock = stock  # {product: quantity}
+
+    def as_dict(self):
+        """The location in get_retail_snapshot's format."""
+        return {"used_m2": self.used_m2, "total_m2": self.total_m2, "stock": dict(self.stock)}
+
+    def __eq__(self, other):
+        return isinstance(other, LocationKpi) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"LocationKpi(used_m2={self.used_m2}, total_m2={self.total_m2}, stock={self.stock})"
+
+
+def get_mirror(page):
+    """Returns the mirror attached to this page, or None."""
+    return _MIRRORS.get(page)
+
+
+class KpiMirror:
+    """The day counter and every owned location's space and stock, kept current by pushes from the page."""
+
+    def __init__(self, page, products):
+        self.page = page
+        self.products = list(products)
+        self.day_text = None  # Raw counter text, e.g. "12 / 30"
+        self.locations = {}  # {location name: LocationKpi}
+        self.ready = False  # True once the first full push has arrived
+        self.pushes = 0
+        self.updated_at = None
+        self._listeners = []
+        self._waiters = []
+
+    async def attach(self):
+        """Starts mirroring. Watching restarts by itself after the page navigates."""
+        _MIRRORS[self.page] = self
+        if self.page not in _BOUND_PAGES:
+            page = self.page
+            # Routed through the registry, so a later mirror on the same page receives the pushes
+            await page.exposeFunction(BINDING_NAME, lambda delta: _dispatch(page, delta))
+            _BOUND_PAGES.add(page)
+        self.page.on('framenavigated', self._on_navigated)
+        await call_helper(self.page, 'watchKpi', self.products, BINDING_NAME)
+        _log.info("KPI mirror attached to %s", self.page.url)
+
+    async def detach(self):
+        """Stops mirroring. Reads fall back to scraping the page."""
+        if _MIRRORS.get(self.page) is self:
+            del _MIRRORS[self.page]
+        self.page.remove_listener('framenavigated', self._on_navigated)
+        self.ready = False
+        if not self.page.isClosed():
+            try:
+                await call_helper(self.page, 'unwatchKpi')
+            except Exception as e:
+                _log.warning("Could not stop the KPI watcher: %s", e)
+
+    def _on_navigated(self, frame):
+        if frame is self.page.mainFrame:
+            self.ready = False
+            asyncio.ensure_future(self._rewatch())
+
+    async def _rewatch(self):
+        try:
+            await call_helper(self.page, 'watchKpi', self.products, BINDING_NAME)
+        except Exception as e:
+            _log.warning("Could not restart the KPI watcher after navigation: %s", e)
+
+    def _apply(self, delta):
+        if delta.get('full'):
+            self.locations = {}
+        self.day_text = delta.get('day')
+        for name, entry in delta['changed'].items():
+            self.locations[name] = LocationKpi(entry['used_m2'], entry['total_m2'], entry['stock'])
+        for name in delta['removed']:
+            self.locations.pop(name, None)
+        self.ready = True
+        self.pushes += 1
+        self.updated_at = time.time()
+
+        changed = set(delta['changed']) | set(delta['removed'])
+        for callback in list(self._listeners):
+            callback(self, changed)
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(changed)
+
+    # --- Reads ---
+    def snapshot(self):
+        """Every location's space and stock, in get_retail_snapshot's format."""
+        return {name: location.as_dict() for name, location in self.locations.items()}
+
+    def on_change(self, callback):
+        """Registers callback(mirror, changed_location_names), called after every push."""
+        self._listeners.append(callback)
+
+    async def wait_for_change(self, timeout=None):
+        """Waits for the next push and returns the names of the locations it changed (empty if only the day did)."""
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self._waiters.remove(waiter)
+
+    # --- Consistency check ---
+    async def verify(self, repair=True):
+        """
+        Re-scrapes the page in full and compares it with the mirror.
+        Returns a list of the differences found (empty if consistent); with repair, the mirror takes the page's state.
+        """
+        day_text = await call_helper(self.page, 'readDay')
+        fresh = {name: LocationKpi(entry['used_m2'], entry['total_m2'], entry['stock'])
+                 for name, entry in (await call_helper(self.page, 'retailSnapshot', self.products)).items()}
+        mismatches = []
+        if day_text != self.day_text:
+            mismatches.append(f"day: mirror {self.day_text!r}, page {day_text!r}")
+        for name in sorted(set(fresh) | set(self.locations)):
+            if self.locations.get(name) != fresh.get(name):
+                mismatches.append(f"{name}: mirror {self.locations.get(name)}, page {fresh.get(name)}")
+        if mismatches and repair:
+            self.day_text = day_text
+            self.locations = fresh
+        return mismatches
+
+
+def _dispatch(page, delta):
+    mirror = _MIRRORS.get(page)
+    if mirror is not None:
+        mirror._apply(delta)
@@ -0,0 +1,87 @@
+# lean_mode.py
+# Opt-in "lean mode" for game tabs under automation: images, fonts, media and analytics are not loaded,
+# jQuery animations are switched off and CSS transitions/animations take no time, so dialogs open and close
+# as fast as the game's own requests allow and idle tabs cost less renderer CPU.
+# Everything is undone by disable(), which the runners call when they let go of a page.
+import asyncio
+import weakref
+
+import botlog
+
+_log = botlog.get_logger("lean_mode")
+
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'media'}
+BLOCKED_URL_FRAGMENTS = ['analytics', 'googletagmanager.com', 'doubleclick.net', 'facebook.net', 'hotjar.com']
+
+# Runs in every document (current and future): no jQuery effects, zero-length CSS transitions and animations
+LEAN_JS = '''
+() => {
+    const apply = () => {
+        if (window.jQuery) window.jQuery.fx.off = true;
+        if (document.getElementById('__msbot_lean') || !document.head) return;
+        const style = document.createElement('style');
+        style.id = '__msbot_lean';
+        style.textContent = '*, *::before, *::after { transition-duration: 0s !important; ' +
+            'transition-delay: 0s !important; animation-duration: 0s !important; animation-delay: 0s !important; }';
+        document.head.appendChild(style);
+    };
+    if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', apply);
+    else apply();
+}
+'''
+
+RESTORE_JS = '''
+() => {
+    if (window.jQuery) window.jQuery.fx.off = false;
+    const style = document.getElementById('__msbot_lean');
+    if (style) style.remove();
+}
+'''
+
+# Per page: the request handler and new-document script id to undo, plus what was blocked
+_LEAN_PAGES = weakref.WeakKeyDictionary()
+
+
+def _should_block(request):
+    return (request.resourceType in BLOCKED_RESOURCE_TYPES
+            or any(fragment in request.url for fragment in BLOCKED_URL_FRAGMENTS))
+
+
+async def enable(page):
+    """Turns lean mode on for a page. Calling it again for the same page does nothing."""
+    if page in _LEAN_PAGES:
+        return
+    state = _LEAN_PAGES[page] = {"handler": None, "script_id": None, "blocked": 0}
+
+    def on_request(request):
+        if _should_block(request):
+            state["blocked"] += 1
+            asyncio.ensure_future(request.abort('blockedbyclient'))
+        else:
+            asyncio.ensure_future(request.continue_())
+
+    state["handler"] = on_request
+    page.on('request', on_request)
+    await page.setRequestInterception(True)
+    result = await page._client.send('Page.addScriptToEvaluateOnNewDocument', {'source': f'({LEAN_JS})()'})
+    state["script_id"] = result.get('identifier')
+    await page.evaluate(LEAN_JS)
+    _log.info("Lean mode enabled for %s", page.url)
+
+
+async def disable(page):
+    """Restores a page's normal loading and animations. Does nothing if lean mode is not on for it."""
+    state = _LEAN_PAGES.pop(page, None)
+    if state is None:
+        return
+    if page.isClosed():
+        return
+    try:
+        page.remove_listener('request', state["handler"])
+        await page.setRequestInterception(False)
+        if state["script_id"]:
+            await page._client.send('Page.removeScriptToEvaluateOnNewDocument', {'identifier': state["script_id"]})
+        await page.evaluate(RESTORE_JS)
+        _log.info("Lean mode disabled for %s (%d requests were blocked)", page.url, state['blocked'])
+    except Exception as e:
+        _log.warning("Could not fully restore %s from lean mode: %s", page.url, e)
@@ -1,51 +1,222 @@
+import argparse
 import asyncio
-from pyppeteer import connect
+import json
 
+import botlog
+import connection
+import engine
+import fleet
+import recorder
+import state_store
 
-async def main():
+_log = botlog.get_logger("main")
+
+DEFAULT_CONFIG = {
+    "browser_url": "http://127.0.0.1:9222",
+    "url_fragments": ["monsoonsim.com"],
+    "product_set": "Juice",
+    "location_set": "Indonesia",
+    "mode": "full",
+    "fill_percentage": 100,
+    "locations": [],  # Empty: scrape the owned locations from the KPI panel
+    "presets": {},  # {"Jakarta": ["Apple Juice"], ...}
+    "fill_targets": {},  # Per-location fill % overrides, e.g. {"Jakarta": 120}
+    "direct_orders": False,  # Replay the learned vendor form POST instead of clicking through the dialog
+    "vendor": None,  # Vendor to order from; None: the cheapest in the day's vendor catalog
+    "max_lead_days": None,  # When choosing the vendor, leave out those taking longer than this to deliver
+    "lean_mode": False,  # Block images/fonts/analytics and turn off UI animations while automating
+    "kpi_mirror": False,  # Keep the KPI panel mirrored in memory (pushed by the page) instead of re-reading it
+    "record": None,  # Path of a .jsonl.gz file to record the session into (see replay.py)
+    "state_file": None,  # JSON file of per-game progress, so a restarted run resumes mid-game (see state_store.py)
+    "fleet": False,  # Drive every matching tab with these settings, not just the first one
+    "games": [],  # Per-game overrides, e.g. [{"url": "sim133.monsoonsim.com", "product_set": "Car"}, ...]
+    "endpoints": [],  # supervisor.py: one worker process per Chrome debugging endpoint
+    "log_level": "INFO",  # DEBUG shows every step (reads, clicks, planning rules)
+    "log_json": False,  # Log JSON lines (with session, day and location fields) instead of text
+    "log_file": None,  # Log to this file instead of stdout
+}
+
+
+def parse_mapping(items, convert=str):
+    """Parses repeated "Location=value" flags into a dictionary."""
+    mapping = {}
+    for item in items or []:
+        location, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected Location=value, got: '{item}'")
+        mapping[location.strip()] = convert(value.strip())
+    return mapping
+
+
+def load_config(args):
+    """Merges the defaults, the JSON config file (if any) and the command line flags, in that order."""
+    config = dict(DEFAULT_CONFIG)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+
+    for key in ["browser_url", "product_set", "location_set", "mode", "fill_percentage", "vendor", "max_lead_days",
+                "record", "state_file", "log_level", "log_file"]:
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    if args.url:
+        config["url_fragments"] = args.url
+    if args.fleet:
+        config["fleet"] = True
+    if args.direct_orders:
+        config["direct_orders"] = True
+    if args.lean:
+        config["lean_mode"] = True
+    if args.kpi_mirror:
+        config["kpi_mirror"] = True
+    if args.log_json:
+        config["log_json"] = True
+    if args.locations:
+        config["locations"] = [name.strip() for name in args.locations.split(",") if name.strip()]
+    config["presets"] = {**config["presets"],
+                         **parse_mapping(args.preset, lambda v: [p.strip() for p in v.split(",") if p.strip()])}
+    config["fill_targets"] = {**config["fill_targets"], **parse_mapping(args.fill_target, int)}
+
+    for game in [config] + config["games"]:
+        if game.get("mode", config["mode"]) not in engine.MODES:
+            raise ValueError(f"Unknown mode '{game['mode']}'. Choose from {engine.MODES}.")
+    return config
+
+
+async def build_sessions(link, config, recording=None, state=None):
     """
-    Connects to an already-running Chrome instance and finds the MonsoonSim page.
+    Matches the configured games to open tabs and builds one GameSession per game.
+    Without a "games" list this is the first matching tab (or every matching tab with "fleet"), using the
+    top-level settings; each "games" entry picks the tab matching its "url" and overrides the top-level settings.
+    Tabs are picked from the DevTools target list, and only the picked ones are attached to (see connection.py).
+    With a "tab_shard" [shard, count], only every count-th of the matched tabs (by target id) is kept.
     """
-    print("Attempting to connect to Chrome on port 9222...")
+    if config["games"]:
+        games, used, matched = [{**config, **game} for game in config["games"]], set(), []
+        # Sorted by id, since the target list is in most-recently-used order and would differ between workers
+        all_targets = sorted(await connection.list_targets(link.browser_url), key=lambda t: t["id"])
+        for game in games:
+            fragments = [game["url"]] if game.get("url") else config["url_fragments"]
+            target = next((t for t in all_targets
+                           if t["id"] not in used and any(fragment in t["url"] for fragment in fragments)), None)
+            if target is None:
+                _log.warning("Could not find a page for game: %s", fragments)
+                continue
+            used.add(target["id"])
+            matched.append((target, game))
+        if config.get("tab_shard"):
+            shard, shard_count = config["tab_shard"]
+            matched = sorted(matched, key=lambda pair: pair[0]["id"])[shard::shard_count]
+    else:
+        targets = await connection.list_targets(link.browser_url, config["url_fragments"])
+        if config.get("tab_shard"):
+            # Only this worker's share of the tabs, when a supervisor splits one browser across processes.
+            # Sorted by id, since the target list is in most-recently-used order and would differ between workers
+            shard, shard_count = config["tab_shard"]
+            targets = sorted(targets, key=lambda t: t["id"])[shard::shard_count]
+        matched = [(target, config) for target in (targets if config["fleet"] else targets[:1])]
 
-    try:
-        # The browserURL is the endpoint created by the --remote-debugging-port flag.
-        browser = await connect(browserURL="http://127.0.0.1:9222")
-        print("Successfully connected to the browser!")
+    sessions = []
+    for target, game in matched:
+        page = await connection.attach(link.browser, target["id"])
+        _log.info("Found MonsoonSIM page: %s", page.url)
+        session = fleet.GameSession(page, name=game.get("name"), product_set=game["product_set"],
+                                    location_set=game["location_set"], mode=game["mode"], lean=game["lean_mode"],
+                                    mirror=game["kpi_mirror"], recording=recording, link=link, target_id=target["id"],
+                                    state=state,
+                                    settings=engine.make_settings(game["locations"], game["presets"],
+                                                                  game["fill_percentage"], game["fill_targets"],
+                                                                  game["direct_orders"], game["vendor"],
+                                                                  game["max_lead_days"]))
+        for location, products in game["presets"].items():
+            unknown = [p for p in products if p not in session.config.all_products]
+            if unknown:
+                _log.warning("Preset for %s names products not in the %s set: %s", location, game['product_set'],
+                             unknown)
+        sessions.append(session)
+    return sessions
 
-        # Get a list of all open tabs (pages)
-        pages = await browser.pages()
 
-        target_page = None
-        target_url_fragment = ["sim133.monsoonsim.com","sim56.monsoonsim.com"]
+async def main(config):
+    """
+    Connects to an already-running Chrome instance, finds the MonsoonSim page(s) and runs the daily automation loop
+    headlessly (no Tkinter), with the settings from the config file / command line.
+    Several games are driven concurrently on this one event loop. If the DevTools connection drops, it is
+    re-established and every game re-attaches to its tab.
+    """
+    _log.info("Attempting to connect to Chrome at %s...", config['browser_url'])
 
-        # Loop through all open pages to find our target
-        # This is the Python equivalent of your AHK's Chrome.GetPageByURL() [cite: 2, 13]
-        for p in pages:
-            for url_fragment in target_url_fragment:
-                if url_fragment in p.url:
-                    target_page = p
-                    break
+    link = connection.BrowserLink(config["browser_url"])
+    try:
+        # The browser_url is the endpoint created by the --remote-debugging-port flag.
+        await link.open()
+        _log.info("Successfully connected to the browser!")
+    except Exception as e:
+        _log.error("Connection failed. Is Chrome running with --remote-debugging-port=9222? Error: %s", e)
+        return
 
-        if target_page:
-            print(f"Found MonsoonSIM page: {target_page.url}")
-            # Bring the page to the front to make sure it's active
+    recording = recorder.Recorder(config["record"]) if config["record"] else None
+    state = state_store.StateStore(config["state_file"]) if config["state_file"] else None
+    try:
+        sessions = await build_sessions(link, config, recording, state)
+        if not sessions:
+            _log.error("Could not find a page with the URL fragment: %s", config['url_fragments'])
+            return
+        await fleet.Fleet(sessions).run()
 
-            # --- From here, you can add your automation logic ---
-            # For example, let's get the title of the page
-            title = await target_page.title()
-            print(f"The page title is: '{title}'")
+    except asyncio.CancelledError:
+        _log.info("Automation loop stopped.")
+    finally:
+        if recording:
+            recording.close()
+            _log.info("Recorded %d records to %s", recording.records, config['record'])
+        await link.close()
+        _log.info("Disconnected from browser. The window will remain open.")
 
-        else:
-            print(f"Could not find a page with the URL fragment: {target_url_fragment}")
 
-        await browser.disconnect()
-        print("Disconnected from browser. The window will remain open.")
+def configure_logging(config):
+    """Sets up the bot's logging (see botlog.py) from the config's log_level, log_json and log_file."""
+    botlog.configure(config["log_level"], config["log_json"], config["log_file"])
 
-    except Exception as e:
-        print(f"Connection failed. Is Chrome running with --remote-debugging-port=9222?")
-        print(f"Error: {e}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the MonsoonSIM automation loop without the GUI.")
+    parser.add_argument("--config", help="JSON config file (see bot_config.example.json)")
+    parser.add_argument("--browser-url", help="Chrome remote debugging endpoint, e.g. http://127.0.0.1:9222")
+    parser.add_argument("--url", action="append", help="URL fragment identifying the game tab (repeatable)")
+    parser.add_argument("--product-set", choices=["Juice", "Mask", "Car", "Coffee", "Electronics"])
+    parser.add_argument("--location-set", choices=["Indonesia", "China"])
+    parser.add_argument("--mode", choices=engine.MODES)
+    parser.add_argument("--fleet", action="store_true", help="Drive every matching tab, not just the first one")
+    parser.add_argument("--direct-orders", action="store_true",
+                        help="After the first UI order, send orders as one request replaying the vendor form")
+    parser.add_argument("--vendor", help="Vendor to order from, e.g. VFG2 (default: the cheapest for each order)")
+    parser.add_argument("--max-lead-days", type=int,
+                        help="When choosing the vendor, skip those that take longer than this to deliver")
+    parser.add_argument("--lean", action="store_true",
+                        help="Lean mode: skip images, fonts and analytics and turn off animations in the game tabs")
+    parser.add_argument("--kpi-mirror", action="store_true",
+                        help="Mirror the KPI panel in memory through page pushes instead of re-reading it")
+    parser.add_argument("--record", help="Record the session into this .jsonl.gz file, for replay.py")
+    parser.add_argument("--state-file", help="Save each game's progress to this JSON file and resume from it")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Least important log messages to show (default: INFO)")
+    parser.add_argument("--log-json", action="store_true", help="Log JSON lines instead of text")
+    parser.add_argument("--log-file", help="Log to this file instead of stdout")
+    parser.add_argument("--fill-percentage", type=int, help="Default target fill level in percent")
+    parser.add_argument("--locations", help="Comma-separated locations to replenish (default: all owned)")
+    parser.add_argument("--preset", action="append", metavar="LOCATION=PRODUCT[,PRODUCT]",
+                        help="Products to prioritize at a location (repeatable)")
+    parser.add_argument("--fill-target", action="append", metavar="LOCATION=PERCENT",
+                        help="Fill level override for one location (repeatable)")
+    return parser
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    config = load_config(build_parser().parse_args())
+    configure_logging(config)
+    try:
+        asyncio.run(main(config))
+    except KeyboardInterrupt:
+        _log.info("Interrupted.")
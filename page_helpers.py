@@ -0,0 +1,442 @@
+# page_helpers.py
+# The in-page JavaScript helper library used by game_api.
+# The bundle is installed once per page (and re-installed by Chrome on every navigation through
+# evaluateOnNewDocument), so Python only sends a short function name plus JSON arguments per call.
+import weakref
+
+HELPER_VERSION = 11
+
+HELPER_JS = '''
+() => {
+    const VERSION = __VERSION__;
+    if (window.__msbot && window.__msbot.version >= VERSION) return;
+
+    const findElement = (selector, selectorType) => {
+        if (selectorType === 'xpath') {
+            return document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+                .singleNodeValue;
+        }
+        return document.querySelector(selector);
+    };
+
+    // Resolves with the element as soon as it exists, or null once timeoutMs runs out
+    const waitForElement = (selector, selectorType, timeoutMs) => new Promise(resolve => {
+        const found = findElement(selector, selectorType);
+        if (found || !timeoutMs) return resolve(found);
+        let timer = null;
+        const observer = new MutationObserver(() => {
+            const el = findElement(selector, selectorType);
+            if (!el) return;
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve(el);
+        });
+        observer.observe(document, {childList: true, subtree: true});
+        timer = setTimeout(() => { observer.disconnect(); resolve(null); }, timeoutMs);
+    });
+
+    const parseNumber = (text) => parseInt(text.replace(/,/g, ''));
+
+    // Visible the way pyppeteer's waitForSelector means it: laid out and not visibility:hidden
+    const isVisible = (el) => !!el && el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+
+    // A vendor box's name: its .vendor-name element, or else the first line of its first <div>
+    const vendorName = (box) => {
+        const el = box.querySelector('.vendor-name') || box.querySelector('div');
+        return el ? el.textContent.trim().split('\\n')[0].trim() : '';
+    };
+
+    // The own text (first non-blank text node) of every <div> in a vendor box, which is what the bot's original
+    // contains(text(), name) XPath matched vendor names against
+    const vendorLabels = (box) => [...box.querySelectorAll('div')]
+        .map(div => [...div.childNodes].find(n => n.nodeType === 3 && n.textContent.trim()))
+        .filter(Boolean).map(n => n.textContent.trim());
+
+    const tabPanel = (tabName) => {
+        const tab = [...document.querySelectorAll('.ui-tabs-tab')].find(t => t.textContent.trim() === tabName);
+        return tab && document.getElementById(tab.getAttribute('aria-controls'));
+    };
+
+    // Elements tagged by markStale before a navigation; a wait for new content skips them
+    const fresh = (selector) => document.querySelector(selector + ':not([data-msbot-stale])');
+
+    // Named readiness conditions for waitFor. Each gets a context (ctx.quietMs(): time since the last DOM
+    // mutation) plus the wait's arguments, and returns something truthy once the condition holds.
+    const conditions = {
+        dialogOpen: () => isVisible(document.querySelector('#facebox #submit_button')),
+        dialogClosed: () => !isVisible(document.querySelector('#facebox')),
+        submitReady: () => {
+            const button = document.querySelector('#facebox #submit_button');
+            return isVisible(button) && !button.disabled && !button.classList.contains('disabled');
+        },
+        tabPanelVisible: (ctx, tabName) => isVisible(tabPanel(tabName)),
+        buttonsEnabled: (ctx, tabName) => {
+            const panel = tabPanel(tabName);
+            return !!panel && !!panel.querySelector('.circle.thecb:not(.disabled)');
+        },
+        // The incoming list has been re-rendered with links, or the previous list is gone and the page has stopped
+        // changing for quietMs (an empty list has nothing to wait for)
+        serviceListReady: (ctx, quietMs) => !!fresh("a[href*='cmd=SRV_INCOMING']")
+            || (ctx.quietMs() >= quietMs && !document.querySelector("a[href*='cmd=SRV_INCOMING']")),
+        dayChanged: (ctx, lastDay) => {
+            const text = helpers.readDay();
+            return text && parseInt(text.split('/')[0]) > lastDay ? text : null;
+        },
+        rateLimitCleared: () => !helpers.rateLimitProbe(),
+        // Vendor boxes rendered since the ones showing were tagged with markStale
+        vendorsListed: () => !!fresh(".vendor-box") && !!document.querySelector(".vendor-box a[href*='BUY_FG']"),
+    };
+
+    const helpers = {
+        version: VERSION,
+
+        // --- Generic UI ---
+        async click(selector, selectorType, timeoutMs) {
+            const el = await waitForElement(selector, selectorType, timeoutMs);
+            if (!el) return false;
+            el.click();
+            return true;
+        },
+
+        // Clicks the first link whose href attribute is exactly href (compared as a string, so any characters
+        // are safe). Returns false if there is none.
+        clickLink(href) {
+            const link = [...document.querySelectorAll('a[href]')].find(a => a.getAttribute('href') === href);
+            if (!link) return false;
+            link.click();
+            return true;
+        },
+
+        // Sets each <select> in values ({selector: optionValue}) the way page.select does.
+        // Returns the selectors that could not be filled.
+        fillForm(values) {
+            const failed = [];
+            for (const [selector, value] of Object.entries(values)) {
+                const select = document.querySelector(selector);
+                if (!select || ![...select.options].some(o => o.value === value)) {
+                    failed.push(selector);
+                    continue;
+                }
+                select.value = value;
+                select.dispatchEvent(new Event('input', {bubbles: true}));
+                select.dispatchEvent(new Event('change', {bubbles: true}));
+            }
+            return failed;
+        },
+
+        // Resolves as soon as the named condition holds, checking it on every DOM mutation and animation frame
+        // (plus a 50 ms poll, since background tabs get no frames), or once timeoutMs runs out (0: no limit).
+        // Resolves with {ok, value, elapsedMs}, value being what the condition returned.
+        waitFor(name, args, timeoutMs) {
+            const condition = conditions[name];
+            if (!condition) throw new Error('Unknown wait condition: ' + name);
+            const start = performance.now();
+            let lastMutation = start;
+            const ctx = {quietMs: () => performance.now() - lastMutation};
+            return new Promise(resolve => {
+                let done = false, observer = null, frame = null, poll = null, timer = null;
+                const finish = (ok, value) => {
+                    done = true;
+                    if (observer) observer.disconnect();
+                    cancelAnimationFrame(frame);
+                    clearInterval(poll);
+                    clearTimeout(timer);
+                    resolve({ok, value: value || null, elapsedMs: Math.round(performance.now() - start)});
+                };
+                const check = () => {
+                    if (done) return;
+                    const value = condition(ctx, ...args);
+                    if (value) finish(true, value);
+                };
+                const onFrame = () => {
+                    check();
+                    if (!done) frame = requestAnimationFrame(onFrame);
+                };
+                check();
+                if (done) return;
+                observer = new MutationObserver(() => {
+                    lastMutation = performance.now();
+                    check();
+                });
+                observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+                frame = requestAnimationFrame(onFrame);
+                poll = setInterval(check, 50);
+                if (timeoutMs > 0) timer = setTimeout(() => finish(false, null), timeoutMs);
+            });
+        },
+
+        // Tags the elements matching selector as left over from before a navigation (see fresh)
+        markStale(selector) {
+            document.querySelectorAll(selector).forEach(el => el.setAttribute('data-msbot-stale', ''));
+        },
+
+        // Whether the facebox dialog is showing its submit button
+        dialogOpen() {
+            return conditions.dialogOpen();
+        },
+
+        // Looks for a visible element holding the message instead of serializing the whole body text
+        rateLimitProbe() {
+            const node = document.evaluate(
+                "//body//*[not(self::script)][contains(text(), 'Slow down, you click too fast')]",
+                document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+            return !!node && node.getClientRects().length > 0;
+        },
+
+        // POSTs form fields the way the page's own forms do (same origin, session cookies included).
+        // Returns the status and the start of the response body, or status 0 if the request could not be sent.
+        async postForm(url, fields, headers) {
+            try {
+                const response = await fetch(url, {method: 'POST', body: new URLSearchParams(fields), headers,
+                                                   credentials: 'same-origin'});
+                return {status: response.status, text: (await response.text()).slice(0, 2000)};
+            } catch (e) {
+                return {status: 0, text: String(e)};
+            }
+        },
+
+        // --- Day counter ---
+        readDay() {
+            const el = document.querySelector('#KPI_DAY____');
+            return el ? el.textContent : null;
+        },
+
+        // Resolves with the counter text as soon as the day passes lastDay, or with null once timeoutMs runs out
+        async waitForDay(lastDay, timeoutMs) {
+            return (await helpers.waitFor('dayChanged', [lastDay], timeoutMs)).value;
+        },
+
+        // --- Retail KPI panel ---
+        ownedRetailLocations() {
+            return [...document.querySelectorAll('#RTL .kpi_title')]
+                .map(el => el.textContent.replace('Retail', '').replace(/\\u00A0/g, ' ').trim());
+        },
+
+        // {locationName: {used_m2, total_m2, stock: {product: qty}}} for every owned location
+        retailSnapshot(products) {
+            const snapshot = {};
+            const names = helpers.ownedRetailLocations();
+            document.querySelectorAll('#RTL .kpi_title').forEach((title, i) => {
+                const entry = {used_m2: null, total_m2: null, stock: {}};
+                for (let el = title.nextElementSibling; el && !el.classList.contains('kpi_title');
+                     el = el.nextElementSibling) {
+                    if (el.tagName !== 'LI') continue;
+                    const text = el.textContent;
+                    if (entry.used_m2 === null && text.includes('Space utilization')) {
+                        const valueEl = el.querySelector('div') || el;
+                        const match = valueEl.textContent.match(/([\\d,]+)\\s*\\/\\s*([\\d,]+)/);
+                        if (match) {
+                            entry.used_m2 = parseNumber(match[1]);
+                            entry.total_m2 = parseNumber(match[2]);
+                        }
+                        continue;
+                    }
+                    const product = products.find(p => !(p in entry.stock) && text.includes(p));
+                    const valueEl = product && el.querySelector(':scope > span.right');
+                    if (valueEl) entry.stock[product] = parseNumber(valueEl.textContent);
+                }
+                snapshot[names[i]] = entry;
+            });
+            return snapshot;
+        },
+
+        // What a procurement retry checks in one call: the day counter, one location's space line
+        // and whether the vendor dialog is still open
+        orderCheckpoint(locationName) {
+            const checkpoint = {day: helpers.readDay(), used_m2: null, total_m2: null, dialogOpen: false};
+            const title = document.querySelectorAll('#RTL .kpi_title')[
+                helpers.ownedRetailLocations().indexOf(locationName)];
+            for (let el = title && title.nextElementSibling; el && !el.classList.contains('kpi_title');
+                 el = el.nextElementSibling) {
+                if (el.tagName !== 'LI' || !el.textContent.includes('Space utilization')) continue;
+                const match = (el.querySelector('div') || el).textContent.match(/([\\d,]+)\\s*\\/\\s*([\\d,]+)/);
+                if (match) {
+                    checkpoint.used_m2 = parseNumber(match[1]);
+                    checkpoint.total_m2 = parseNumber(match[2]);
+                }
+                break;
+            }
+            checkpoint.dialogOpen = helpers.dialogOpen();
+            return checkpoint;
+        },
+
+        // Pushes the day counter and Retail KPI panel to Python through the exposed binding, whenever they change.
+        // Each push is {day, changed: {location: entry}, removed: [location], full}; only what changed since the
+        // previous push is sent, except for the first push after (re)starting, which is full.
+        watchKpi(products, bindingName) {
+            helpers.unwatchKpi();
+            const sent = {day: null, locations: {}};
+            let full = true, scheduled = false;
+            const push = () => {
+                scheduled = false;
+                const day = helpers.readDay();
+                const snapshot = helpers.retailSnapshot(products);
+                const changed = {};
+                for (const [name, entry] of Object.entries(snapshot)) {
+                    const json = JSON.stringify(entry);
+                    if (sent.locations[name] !== json) {
+                        changed[name] = entry;
+                        sent.locations[name] = json;
+                    }
+                }
+                const removed = Object.keys(sent.locations).filter(name => !(name in snapshot));
+                removed.forEach(name => delete sent.locations[name]);
+                if (!full && day === sent.day && !Object.keys(changed).length && !removed.length) return;
+                sent.day = day;
+                window[bindingName]({day, changed, removed, full});
+                full = false;
+            };
+            const watched = '#RTL, #KPI_DAY____';
+            const touchesKpi = (record) => {
+                const target = record.target.nodeType === 1 ? record.target : record.target.parentElement;
+                if (target && target.closest(watched)) return true;
+                return [...record.addedNodes, ...record.removedNodes].some(node =>
+                    node.nodeType === 1 && (node.matches(watched) || node.querySelector(watched)));
+            };
+            const observer = new MutationObserver(records => {
+                if (scheduled || !records.some(touchesKpi)) return;
+                scheduled = true;
+                setTimeout(push, 0);  // One push per burst of mutations
+            });
+            observer.observe(document, {childList: true, subtree: true, characterData: true});
+            helpers.kpiObserver = observer;
+            push();
+        },
+
+        unwatchKpi() {
+            if (helpers.kpiObserver) helpers.kpiObserver.disconnect();
+            helpers.kpiObserver = null;
+        },
+
+        // --- Retail vendor page ---
+        // Every vendor box on the vendor page as {name, href, prices: {product: unit price}, lead_time_days, info,
+        // labels}, info being the box's other text lines and labels what vendorLabels reads. Prices are read from
+        // lines naming a product and a $ amount and the lead time from a "Lead time" line; either is null (or
+        // missing from prices) where the box doesn't show it.
+        vendorCatalog(products) {
+            return [...document.querySelectorAll('.vendor-box')].map(box => {
+                const link = box.querySelector("a[href*='BUY_FG']");
+                const name = vendorName(box);
+                const vendor = {name, href: link && link.getAttribute('href'), prices: {}, lead_time_days: null,
+                                info: [], labels: vendorLabels(box)};
+                for (const el of box.querySelectorAll('div')) {
+                    if (el.querySelector('div')) continue;  // Only the innermost lines
+                    const text = el.textContent.replace(/\\s+/g, ' ').trim();
+                    if (!text || text === name) continue;
+                    vendor.info.push(text);
+                    const lead = text.match(/lead\\s*time\\D*(\\d+)/i);
+                    if (lead) {
+                        vendor.lead_time_days = parseInt(lead[1]);
+                        continue;
+                    }
+                    const price = text.match(/\\$\\s*([\\d,]+(?:\\.\\d+)?)/);
+                    const product = price && products.find(p => text.includes(p));
+                    if (product && !(product in vendor.prices)) {
+                        vendor.prices[product] = parseFloat(price[1].replace(/,/g, ''));
+                    }
+                }
+                return vendor;
+            });
+        },
+
+        // Clicks a vendor's BUY_FG link, found by the href vendorCatalog read, or else by the vendor's name: the box
+        // it names, or the first box with a <div> whose own text contains it (as the original XPath did).
+        // Returns false if the vendor page is not showing that vendor.
+        openVendor(name, href) {
+            const boxes = [...document.querySelectorAll('.vendor-box')];
+            const links = boxes.map(box => box.querySelector("a[href*='BUY_FG']"));
+            let link = href ? links.find(a => a && a.getAttribute('href') === href) : null;
+            if (!link) link = links[boxes.findIndex(box => vendorName(box) === name)];
+            if (!link) link = links[boxes.findIndex(box => vendorLabels(box).some(label => label.includes(name)))];
+            if (!link) return false;
+            link.click();
+            return true;
+        },
+
+        // --- Service module ---
+        readMandays() {
+            const mandays = [];
+            document.querySelectorAll('.col-md-5').forEach(element => {
+                const match = element.textContent.match(/Required Mandays\\s*:\\s*(\\d+)/);
+                if (match) mandays.push(parseInt(match[1]));
+            });
+            return mandays;
+        },
+
+        forceOpenTab(tabName) {
+            const tabs = document.querySelectorAll('.ui-tabs-tab');
+            tabs.forEach(tab => tab.classList.remove('ui-tabs-active', 'ui-state-active'));
+            const selectedTab = [...tabs].find(tab => tab.textContent.includes(tabName));
+            if (!selectedTab) return false;
+            selectedTab.classList.add('ui-tabs-active', 'ui-state-active');
+            const panelId = selectedTab.querySelector('a').getAttribute('href');
+            document.querySelectorAll('.ui-tabs-panel').forEach(p => p.style.display = 'none');
+            document.querySelector(panelId).style.display = 'block';
+            return true;
+        },
+
+        // The pending requests in the incoming list: [{href, label}]
+        serviceRequestLinks() {
+            return [...document.querySelectorAll("a[href*='cmd=SRV_INCOMING']")]
+                .map(a => ({href: a.getAttribute('href'), label: a.textContent.trim()}));
+        },
+
+        // Reads the open request's mandays and staffs every tab that needs it, in one call.
+        // Returns {mandays, assigned} with one entry per tab, in tabNames order.
+        async allocateServiceStaff(tabNames) {
+            const mandays = helpers.readMandays();
+            const assigned = [];
+            for (let i = 0; i < tabNames.length; i++) {
+                assigned.push(mandays[i] > 0 ? await helpers.clickButtonsForTab(tabNames[i], mandays[i]) : 0);
+            }
+            return {mandays, assigned};
+        },
+
+        // Opens the tab and clicks up to requiredClicks enabled staff buttons in it. Returns the number clicked.
+        // Waits for the panel to show and its buttons to be enabled rather than for a fixed delay.
+        async clickButtonsForTab(tabName, requiredClicks) {
+            helpers.forceOpenTab(tabName);
+            await helpers.waitFor('tabPanelVisible', [tabName], 1000);
+            await helpers.waitFor('buttonsEnabled', [tabName], 300);
+            const panel = tabPanel(tabName);
+            if (!panel) return 0;
+            const buttons = [...panel.querySelectorAll('.circle.thecb:not(.disabled)')].slice(0, requiredClicks);
+            buttons.forEach(button => window.jQuery ? window.jQuery(button).trigger('click') : button.click());
+            return buttons.length;
+        },
+    };
+
+    window.__msbot = helpers;
+}
+'''.replace('__VERSION__', str(HELPER_VERSION))
+
+# Calls a helper by name, or reports that the bundle is missing (e.g. a document loaded before it was registered)
+_CALL_JS = '''
+(name, args, version) => {
+    const helpers = window.__msbot;
+    if (!helpers || helpers.version < version) return {__msbot_missing__: true};
+    return helpers[name](...args);
+}
+'''
+
+# Pages that already have the bundle registered for new documents
+_REGISTERED_PAGES = weakref.WeakSet()
+
+
+async def install_helpers(page):
+    """Installs the helper bundle in the current document and registers it for every future navigation."""
+    if page not in _REGISTERED_PAGES:
+        await page.evaluateOnNewDocument(HELPER_JS)
+        _REGISTERED_PAGES.add(page)
+    await page.evaluate(HELPER_JS)
+
+
+async def call_helper(page, name, *args):
+    """Runs window.__msbot.<name>(*args) in the page, installing the bundle first if needed."""
+    if page not in _REGISTERED_PAGES:
+        await install_helpers(page)
+    result = await page.evaluate(_CALL_JS, name, list(args), HELPER_VERSION)
+    if isinstance(result, dict) and result.get('__msbot_missing__'):
+        await install_helpers(page)
+        result = await page.evaluate(_CALL_JS, name, list(args), HELPER_VERSION)
+    return result
@@ -0,0 +1,291 @@
+# planner.py
+# The retail ordering maths, as pure synchronous functions over plain inputs: no page and no printing.
+# game_api plans every location through plan_orders; plan_locations plans a whole day's locations in one
+# NumPy batch (replay.py uses it). benchmarks/bench_planner.py times both. choose_vendor picks the vendor to
+# order from out of the day's vendor catalog.
+import math
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for batch planning (plan_batch); plan_locations falls back to plan_orders
+    np = None
+
+PRIORITY_SHARE = 0.60  # Share of the target space split between the prioritized products (the rest goes to the others)
+
+
+class Catalog:
+    """
+    A product set's planning data: its products (in order), the m² per unit of each, the valid order sizes
+    (largest first) and each product's (quantity, m²) lots (smallest first).
+    Built from a product set dictionary such as game_api.JUICE_SET.
+    """
+
+    def __init__(self, product_set):
+        self.products = list(product_set["code_map"].keys())
+        self.space_usage = dict(product_set["space_usage"])
+        self.quantities_desc = sorted(product_set["valid_order_quantities"], reverse=True)
+        self.lots = {product: [(qty, qty * space) for qty in reversed(self.quantities_desc)]
+                     for product, space in self.space_usage.items()}
+
+
+def product_quotas(target_space, products, prioritized_products=()):
+    """
+    Splits the target space into per-product quotas (m²): evenly without priorities, otherwise 60% shared by the
+    prioritized products and 40% by the rest.
+    """
+    if not prioritized_products:
+        return {p: target_space / len(products) for p in products}
+    quotas = {}
+    non_prioritized_products = [p for p in products if p not in prioritized_products]
+    prio_quota = (target_space * PRIORITY_SHARE) / len(prioritized_products)
+    non_prio_quota = (target_space * (1 - PRIORITY_SHARE)) / len(non_prioritized_products) \
+        if non_prioritized_products else 0
+    for p in prioritized_products: quotas[p] = prio_quota
+    for p in non_prioritized_products: quotas[p] = non_prio_quota
+    return quotas
+
+
+def space_to_fill(stock, quotas, catalog):
+    """How much space (m²) each product is short of its quota; negative when it is over it."""
+    return {product: quotas.get(product, 0) - stock.get(product, 0) * catalog.space_usage.get(product, 0.01)
+            for product in catalog.products}
+
+
+def best_fit_quantity(available_space, space_per_unit, quantities_desc):
+    """The largest valid order size that fits in the available space (0 if none does)."""
+    if available_space <= 0 or space_per_unit <= 0: return 0
+    max_units_possible = math.floor(available_space / space_per_unit)
+    if max_units_possible == 0: return 0
+    for qty in quantities_desc:
+        if qty <= max_units_possible: return qty
+    return 0
+
+
+def optimal_orders(gaps, physical_remaining_space, prioritized_products, catalog):
+    """
+    Picks at most one lot per product so that no product goes past its own quota and the combined order fits
+    in the physical space, filling as much of it as possible.
+    Ties go to the plan that gives more space to prioritized products, then to larger lots for earlier products.
+    Solved as a multiple-choice knapsack: a DP over products whose states are the distinct space totals so far.
+    """
+    if physical_remaining_space <= 0: return {}
+    # space used so far -> best (prioritized space, chosen quantities) reaching it
+    states = {0.0: (0.0, ())}
+    for product in catalog.products:
+        gap = gaps.get(product, 0)
+        max_units = math.floor(gap / catalog.space_usage[product]) if gap > 0 else 0
+        lots = [(0, 0.0)] + [lot for lot in catalog.lots[product] if lot[0] <= max_units]
+        is_prioritized = product in prioritized_products
+        next_states = {}
+        for used_space, (prio_space, quantities) in states.items():
+            for qty, lot_space in lots:
+                total_space = round(used_space + lot_space, 9)
+                if total_space > physical_remaining_space: break  # Lots are sorted, so the rest won't fit either
+                candidate = (prio_space + lot_space if is_prioritized else prio_space, quantities + (qty,))
+                best = next_states.get(total_space)
+                if best is None or candidate > best:
+                    next_states[total_space] = candidate
+        states = next_states
+    _, best_quantities = states[max(states)]
+    return {product: qty for product, qty in zip(catalog.products, best_quantities) if qty > 0}
+
+
+def orders_from_gaps(gaps, physical_remaining_space, catalog, prioritized_products=()):
+    """
+    Orders the largest lot within each product's gap; if those together overflow the physical space,
+    re-plans them with optimal_orders. Returns (orders, scaled_back).
+    """
+    orders = {}
+    for product in catalog.products:
+        qty = best_fit_quantity(gaps[product], catalog.space_usage[product], catalog.quantities_desc)
+        if qty > 0:
+            orders[product] = qty
+    planned_order_space = sum(q * catalog.space_usage.get(p, 0) for p, q in orders.items())
+    if planned_order_space > physical_remaining_space:
+        # Each product already has its largest lot within quota, so only an overflow needs the exact planner
+        return optimal_orders(gaps, physical_remaining_space, prioritized_products, catalog), True
+    return orders, False
+
+
+def plan_orders(stock, used_m2, total_m2, catalog, prioritized_products=(), fill_percentage=100):
+    """
+    Plans one location's order: the quantities to buy per product, e.g. {"Apple Juice": 12000}, to bring its stock
+    towards fill_percentage of total_m2 (split by priority) without exceeding the physical space left.
+    """
+    quotas = product_quotas(total_m2 * (fill_percentage / 100.0), catalog.products, prioritized_products)
+    gaps = space_to_fill(stock, quotas, catalog)
+    orders, _ = orders_from_gaps(gaps, total_m2 - used_m2, catalog, prioritized_products)
+    return orders
+
+
+# --- Vendor Choice ---
+def is_vendor(vendor, name):
+    """
+    Whether a catalog entry is the named vendor: by its name, or by a label containing the name
+    (the way the bot's original vendor XPath matched it).
+    """
+    return vendor["name"] == name or any(name in label for label in vendor.get("labels") or ())
+
+
+def order_cost(vendor, orders):
+    """What an order would cost at a vendor, from its catalog prices; None if it shows no price for a product."""
+    prices = vendor.get("prices") or {}
+    if any(prices.get(product) is None for product in orders):
+        return None
+    return sum(prices[product] * qty for product, qty in orders.items())
+
+
+def choose_vendor(vendors, orders, max_lead_days=None, default=None):
+    """
+    Picks the vendor to place one location's order with from a vendor catalog (see game_api.get_vendor_catalog):
+    the cheapest for the whole order, ties going to the shorter lead time, then to the earlier vendor.
+    Vendors that take longer than max_lead_days to deliver are left out. If no vendor prices every product ordered,
+    the default vendor is kept when it is listed (see is_vendor), else the shortest lead time wins.
+    Returns None if no vendor is left.
+    """
+    candidates = [v for v in vendors if max_lead_days is None or v.get("lead_time_days") is None
+                  or v["lead_time_days"] <= max_lead_days]
+    if not candidates:
+        return None
+    costs = [order_cost(v, orders) for v in candidates]
+    if all(cost is None for cost in costs):
+        # Prefer an exact name match, since a label like "VFG2" is also contained in "VFG20"
+        matches = sorted((v for v in candidates if default and is_vendor(v, default)),
+                         key=lambda v: v["name"] != default)
+        if matches:
+            return matches[0]
+
+    def rank(i):
+        lead = candidates[i].get("lead_time_days")
+        return (costs[i] is None, costs[i] or 0, math.inf if lead is None else lead, i)
+
+    return candidates[min(range(len(candidates)), key=rank)]
+
+
+# --- Batch Planning (NumPy) ---
+# Plans many locations at once as array operations: one row per location, one column per catalog product.
+# The result is identical to plan_orders, location by location. Requires numpy; plan_locations falls back
+# to plan_orders without it.
+_COMBINATIONS = {}  # id(catalog) -> (catalog, quantities, lot spaces, rounded totals), ordered for tie-breaking
+_BATCH_CHUNK = 512  # Overflowing locations scaled back per array pass (bounds memory to chunk x combinations)
+
+
+def _lot_combinations(catalog):
+    """
+    Every choice of at most one lot per product, as arrays. Sorted by quantities, largest first, so the first
+    best candidate is also the one optimal_orders would pick among equals. Totals are rounded the same way too.
+    """
+    cached = _COMBINATIONS.get(id(catalog))
+    if cached is not None and cached[0] is catalog:
+        return cached[1:]
+    options = [[(0, 0.0)] + catalog.lots[product] for product in catalog.products]
+    combinations = [()]
+    for lots in options:
+        combinations = [combination + (lot,) for combination in combinations for lot in lots]
+    combinations.sort(key=lambda combination: tuple(qty for qty, _ in combination), reverse=True)
+    quantities = np.array([[qty for qty, _ in c] for c in combinations], dtype=np.int64)
+    spaces = np.array([[space for _, space in c] for c in combinations], dtype=np.float64)
+    totals = []
+    for combination in combinations:
+        total = 0.0
+        for _, space in combination:
+            total = round(total + space, 9)
+        totals.append(total)
+    totals = np.array(totals, dtype=np.float64)
+    _COMBINATIONS[id(catalog)] = (catalog, quantities, spaces, totals)
+    return quantities, spaces, totals
+
+
+def _scale_back_batch(max_units, remaining, priority_mask, catalog):
+    """optimal_orders for many locations: the best feasible lot combination per row."""
+    quantities, spaces, totals = _lot_combinations(catalog)
+    result = np.zeros(max_units.shape, dtype=np.int64)
+    for start in range(0, len(remaining), _BATCH_CHUNK):
+        rows = slice(start, start + _BATCH_CHUNK)
+        feasible = np.all(quantities[None, :, :] <= max_units[rows, None, :], axis=2)
+        feasible &= totals[None, :] <= remaining[rows, None]
+        # Most space used first, then most space for prioritized products, then the first (largest) quantities
+        best_total = np.where(feasible, totals[None, :], -1.0).max(axis=1)
+        candidates = feasible & (totals[None, :] == best_total[:, None])
+        prio_space = np.zeros(candidates.shape)
+        for j in range(len(catalog.products)):
+            prio_space = prio_space + np.where(priority_mask[rows, j, None], spaces[None, :, j], 0.0)
+        best_prio = np.where(candidates, prio_space, -1.0).max(axis=1)
+        candidates &= prio_space == best_prio[:, None]
+        choice = candidates.argmax(axis=1)
+        chosen = quantities[choice]
+        chosen[~candidates.any(axis=1)] = 0  # No room at all
+        result[rows] = chosen
+    return result
+
+
+def plan_batch(stock, used_m2, total_m2, catalog, priority_mask=None, fill_percentage=100):
+    """
+    Plans every location at once. stock is a locations x products array (in catalog.products order),
+    used_m2 and total_m2 are per location, priority_mask is a locations x products boolean array and
+    fill_percentage is one value or one per location.
+    Returns the day's order book: a locations x products array of quantities to order (0: none).
+    """
+    stock = np.asarray(stock, dtype=np.float64)
+    used_m2 = np.asarray(used_m2, dtype=np.float64)
+    total_m2 = np.asarray(total_m2, dtype=np.float64)
+    count, product_count = stock.shape
+    if priority_mask is None:
+        priority_mask = np.zeros(stock.shape, dtype=bool)
+    priority_mask = np.asarray(priority_mask, dtype=bool)
+    fill = np.broadcast_to(np.asarray(fill_percentage, dtype=np.float64), (count,))
+    space_usage = np.array([catalog.space_usage[p] for p in catalog.products])
+    ascending = np.array(catalog.quantities_desc[::-1], dtype=np.int64)
+
+    # Quotas: an even split, or 60% over the prioritized products and 40% over the rest
+    target = total_m2 * (fill / 100.0)
+    prio_count = priority_mask.sum(axis=1)
+    other_count = product_count - prio_count
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prio_quota = (target * PRIORITY_SHARE) / prio_count
+        other_quota = np.where(other_count > 0, (target * (1 - PRIORITY_SHARE)) / other_count, 0.0)
+    quotas = np.where(prio_count[:, None] == 0, (target / product_count)[:, None],
+                      np.where(priority_mask, prio_quota[:, None], other_quota[:, None]))
+
+    # Largest lot within each product's gap, through a binary search over the valid order sizes
+    gaps = quotas - stock * space_usage
+    with np.errstate(divide='ignore', invalid='ignore'):
+        max_units = np.where(gaps > 0, np.floor(gaps / space_usage), 0).astype(np.int64)
+    index = np.searchsorted(ascending, max_units, side='right') - 1
+    orders = np.where(index >= 0, ascending[np.maximum(index, 0)], 0)
+
+    # Scale back the locations whose orders overflow their physical space
+    remaining = total_m2 - used_m2
+    planned_space = np.zeros(count)
+    for j in range(product_count):
+        planned_space = planned_space + np.where(orders[:, j] > 0, orders[:, j] * space_usage[j], 0.0)
+    overflow = planned_space > remaining
+    if overflow.any():
+        scaled = _scale_back_batch(max_units[overflow], remaining[overflow], priority_mask[overflow], catalog)
+        scaled[remaining[overflow] <= 0] = 0
+        orders[overflow] = scaled
+    return orders
+
+
+def plan_locations(locations, catalog):
+    """
+    Plans a list of (stock, used_m2, total_m2, prioritized_products, fill_percentage) locations in one batch,
+    returning one orders dictionary per location (as plan_orders would). Uses plan_batch when numpy is installed.
+    """
+    products = catalog.products
+    results = [None] * len(locations)
+    batch = []
+    for i, (stock, used_m2, total_m2, priorities, fill) in enumerate(locations):
+        # Priorities naming unknown (or repeated) products still count towards the 60% split; a mask can't say that
+        if np is None or len(set(priorities)) != len(priorities) or not set(priorities) <= set(products):
+            results[i] = plan_orders(stock, used_m2, total_m2, catalog, priorities, fill)
+        else:
+            batch.append(i)
+    if batch:
+        book = plan_batch([[locations[i][0].get(p, 0) for p in products] for i in batch],
+                          [locations[i][1] for i in batch], [locations[i][2] for i in batch], catalog,
+                          [[p in locations[i][3] for p in products] for i in batch],
+                          [locations[i][4] for i in batch])
+        for i, row in zip(batch, book.tolist()):
+            results[i] = {p: qty for p, qty in zip(products, row) if qty > 0}
+    return results
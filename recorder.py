@@ -0,0 +1,132 @@
+# recorder.py
+# Records what the bot saw and did during a session into an append-only, gzip-compressed JSON-lines file:
+# each day's KPI snapshot, every plan computed for a location (with its inputs), the UI actions issued and
+# their outcomes, rate-limit hits, and the result of each location / service request. replay.py reads it back.
+# Recording is opt-in: record() does nothing unless a recorder is active in the current context.
+import contextlib
+import contextvars
+import gzip
+import json
+import threading
+import time
+import zlib
+
+# The recorder and game name of the session running in the current context (see use_recorder)
+_ACTIVE = contextvars.ContextVar("monsoonsim_recorder", default=None)
+
+
+class Recorder:
+    """An append-only recording file. Several sessions may share one; each record carries its game's name."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = gzip.open(path, "at", encoding="utf-8")  # A new gzip member is appended to an existing file
+        self._lock = threading.Lock()
+
+    def write(self, record_type, game=None, **fields):
+        record = {"t": round(time.time(), 3), "type": record_type}
+        if game is not None:
+            record["game"] = game
+        record.update(fields)
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.records += 1
+
+    def flush(self):
+        """Makes everything written so far readable, even if the process dies afterwards."""
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+@contextlib.contextmanager
+def use_recorder(recorder, game=None):
+    """Makes record() write to this recorder (tagged with the game's name) inside the block."""
+    token = _ACTIVE.set((recorder, game) if recorder is not None else None)
+    try:
+        yield recorder
+    finally:
+        _ACTIVE.reset(token)
+
+
+def record(record_type, **fields):
+    """Writes one record to the active recorder, if there is one."""
+    active = _ACTIVE.get()
+    if active is not None:
+        recorder, game = active
+        recorder.write(record_type, game, **fields)
+
+
+def flush():
+    """Flushes the active recorder, if there is one (called once per game day)."""
+    active = _ACTIVE.get()
+    if active is not None:
+        active[0].flush()
+
+
+_GZIP_HEADER = b"\x1f\x8b\x08"  # Starts every gzip member (magic number, deflate)
+_READ_BLOCK = 4096
+
+
+def _inflate_member(data, pos):
+    """
+    Decompresses the gzip member at pos. Returns (its bytes, where it ends), the end being None if the member
+    was cut off, in which case the bytes are everything up to the cut.
+    """
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks, block_start, block_size = [], pos, _READ_BLOCK
+    while block_start < len(data):
+        block = data[block_start:block_start + block_size]
+        try:
+            chunks.append(decoder.decompress(block))
+        except zlib.error:
+            if block_size == 1:
+                return b"".join(chunks), None
+            # A failing block decodes to nothing, so decode up to it again and go through it byte by byte
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            decoder.decompress(data[pos:block_start])
+            block_size = 1
+            continue
+        if decoder.eof:
+            return b"".join(chunks), block_start + len(block) - len(decoder.unused_data)
+        block_start += len(block)
+    return b"".join(chunks), len(data)
+
+
+def _decode_members(data):
+    """
+    Yields the decompressed text of each gzip member in data. A member cut off by a crash (its writer died before
+    closing it) yields what can be decoded of it; reading then resumes at the next member header, since a later
+    run may have appended to the same file.
+    """
+    pos = 0
+    while pos < len(data):
+        text, end = _inflate_member(data, pos)
+        if end is None:
+            next_header = data.find(_GZIP_HEADER, pos + 1)
+            end = next_header if next_header != -1 else len(data)
+        yield text.decode("utf-8", errors="replace")
+        pos = end
+
+
+def read_records(path):
+    """
+    Yields the records of a recording file in the order they were written. Everything written before a crash is
+    kept: the lines of a cut-off member that can't be read are skipped, and the members after it are read.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    for text in _decode_members(data):
+        for line in text.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                pass  # The end of a member cut off mid-write
@@ -0,0 +1,143 @@
+# replay.py
+# Replays a session recorded with --record (see recorder.py) without a browser: every recorded plan is
+# recomputed from its recorded KPI line and compared with what the bot decided at the time, and every day's
+# snapshot is re-planned for all configured locations in one batch, timing the planner. Every vendor choice is
+# made again from the day's recorded vendor catalog. Exits with status 1 if any plan or vendor choice differs,
+# so strategy changes can be regression-tested against real games.
+#   python replay.py recordings/session.jsonl.gz
+import argparse
+import asyncio
+import collections
+import sys
+import time
+
+import botlog
+import game_api
+import planner
+import recorder
+
+
+class GameReplay:
+    """The recorded history of one game, and the results of planning it again."""
+
+    def __init__(self, name):
+        self.name = name
+        self.config = game_api.GameConfig()
+        self.settings = None
+        self.days = []
+        self.plans = 0
+        self.plan_mismatches = []
+        self.vendors = []
+        self.vendor_choices = 0
+        self.vendor_mismatches = []
+        self.snapshot_plans = 0
+        self.planning_seconds = 0.0
+        self.actions = collections.Counter()
+        self.failed_actions = collections.Counter()
+        self.action_ms = 0
+        self.rate_limit_hits = 0
+        self.results = collections.Counter()
+
+    async def _plan(self, location, kpi, priorities, fill):
+        start = time.perf_counter()
+        orders = await game_api._calculate_order_logic(None, location, priorities, fill, {location: kpi})
+        self.planning_seconds += time.perf_counter() - start
+        return orders
+
+    async def feed(self, entry):
+        kind = entry["type"]
+        if kind == "session":
+            self.config = game_api.GameConfig(entry["product_set"], entry["location_set"])
+        elif kind == "day":
+            self.days.append(entry["day"])
+            self.settings = entry["settings"]
+        elif kind == "plan":
+            self.plans += 1
+            with game_api.use_config(self.config):
+                orders = await self._plan(entry["location"], entry["kpi"], entry["priorities"], entry["fill"])
+            if orders != entry["orders"]:
+                self.plan_mismatches.append((self.days[-1] if self.days else None, entry["location"],
+                                             entry["orders"], orders))
+        elif kind == "snapshot" and self.settings:
+            # The whole day's order book in one batch (planner.plan_locations)
+            locations = []
+            with game_api.use_config(self.config):
+                for location in self.settings["locations"]:
+                    try:
+                        kpi = game_api._get_location_from_snapshot(entry["snapshot"], location)
+                    except Exception:
+                        continue  # Not owned, or an incomplete KPI line; the live bot skipped it too
+                    fill = self.settings["fill_targets"].get(location, self.settings["fill_percentage"])
+                    locations.append((kpi["stock"], kpi["used_m2"], kpi["total_m2"],
+                                      self.settings["presets"].get(location, []), fill))
+            start = time.perf_counter()
+            planner.plan_locations(locations, self.config.catalog)
+            self.planning_seconds += time.perf_counter() - start
+            self.snapshot_plans += len(locations)
+        elif kind == "vendors":
+            self.vendors = entry["vendors"]
+        elif kind == "vendor":
+            self.vendor_choices += 1
+            choice = planner.choose_vendor(self.vendors, entry["orders"], entry["max_lead_days"],
+                                           game_api.DEFAULT_VENDOR)
+            if choice is None or choice["name"] != entry["vendor"]:
+                self.vendor_mismatches.append((self.days[-1] if self.days else None, entry["location"],
+                                               entry["vendor"], choice and choice["name"]))
+        elif kind == "action":
+            self.actions[entry["action"]] += 1
+            self.action_ms += entry["ms"]
+            if not entry["ok"]:
+                self.failed_actions[entry["action"]] += 1
+        elif kind == "rate_limit":
+            self.rate_limit_hits += 1
+        elif kind == "result":
+            self.results[f"{entry['kind']}: {entry['result'].split(':')[0].split('.')[0]}"] += 1
+
+    def report(self, show=10):
+        lines = [f"=== {self.name} ({self.config.product_set} / {self.config.location_set}) ===",
+                 f"Days: {len(self.days)} ({self.days[0]}-{self.days[-1]})" if self.days else "Days: 0",
+                 f"Plans re-checked: {self.plans}, differing: {len(self.plan_mismatches)}",
+                 f"Vendor choices re-checked: {self.vendor_choices}, differing: {len(self.vendor_mismatches)}",
+                 f"Snapshot plans: {self.snapshot_plans}, planning time: {self.planning_seconds * 1000:.1f} ms total",
+                 f"UI actions: {sum(self.actions.values())} ({self.action_ms / 1000:.1f} s), "
+                 f"failed: {sum(self.failed_actions.values())}, rate-limit hits: {self.rate_limit_hits}"]
+        for action, count in self.actions.most_common():
+            lines.append(f"    {action:<24} {count:>6}  failed {self.failed_actions[action]:>4}")
+        for result, count in self.results.most_common():
+            lines.append(f"    {result:<60} {count:>5}")
+        for day, location, recorded, replayed in self.plan_mismatches[:show]:
+            lines.append(f"    DIFF day {day} {location}: recorded {recorded}, replayed {replayed}")
+        for day, location, recorded, replayed in self.vendor_mismatches[:show]:
+            lines.append(f"    VENDOR DIFF day {day} {location}: recorded {recorded}, replayed {replayed}")
+        return "\n".join(lines)
+
+
+async def replay(path, game=None):
+    """Replays a recording file. Returns {game name: GameReplay}."""
+    games = {}
+    for entry in recorder.read_records(path):
+        name = entry.get("game") or "game"
+        if game is not None and name != game:
+            continue
+        if name not in games:
+            games[name] = GameReplay(name)
+        await games[name].feed(entry)
+    return games
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the planner, without a browser.")
+    parser.add_argument("recording", help="A .jsonl.gz file written with --record")
+    parser.add_argument("--game", help="Only replay this game (by its recorded name)")
+    parser.add_argument("--show", type=int, default=10, help="Number of differing plans to list per game")
+    parser.add_argument("--log-level", default="ERROR", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Log the planner's messages down to this level (default: errors only)")
+    args = parser.parse_args()
+    botlog.configure(args.log_level)
+
+    start = time.perf_counter()
+    replays = asyncio.run(replay(args.recording, args.game))
+    for game_replay in replays.values():
+        print(game_replay.report(args.show))
+    print(f"Replayed {len(replays)} game(s) in {time.perf_counter() - start:.2f} s")
+    sys.exit(1 if any(r.plan_mismatches or r.vendor_mismatches for r in replays.values()) else 0)
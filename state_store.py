@@ -0,0 +1,104 @@
+# state_store.py
+# What the bot has learned about each game, kept on disk so a restarted bot picks up where it left off:
+# the product and location sets, the owned locations, the priority presets (per location set), the fill targets,
+# which loop was running and the last day it completed. One JSON file, keyed by game (the tab's host and path),
+# rewritten atomically on every change so a crash never leaves it half-written. Writers take a lock on a sidecar
+# file (<path>.lock) around each read-merge-write, so processes sharing the file never drop each other's updates.
+import contextlib
+import json
+import os
+import tempfile
+import time
+import urllib.parse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import botlog
+
+_log = botlog.get_logger("state_store")
+
+DEFAULT_PATH = "monsoonsim_state.json"
+
+
+def game_key(url):
+    """The key a game's state is filed under: its URL without scheme, query or fragment."""
+    parts = urllib.parse.urlsplit(url)
+    return parts.netloc + (parts.path or "/")
+
+
+class StateStore:
+    """A JSON file of per-game state dictionaries. Processes driving different games may share one."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.games = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("games", {})
+        except FileNotFoundError:
+            return {}
+        except (ValueError, AttributeError) as e:
+            _log.warning("Ignoring unreadable state file %s: %s", self.path, e)
+            return {}
+
+    def get(self, url):
+        """The saved state of the game at this URL (a copy), or an empty dictionary."""
+        return json.loads(json.dumps(self.games.get(game_key(url), {})))
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds an exclusive lock on the sidecar lock file, shared by every process using this state file."""
+        with open(self.path + ".lock", "a+b") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def update(self, url, **fields):
+        """Merges the fields into the game's saved state and writes the file if anything changed."""
+        key = game_key(url)
+        with self._locked():
+            # Re-read first so what other processes saved since we loaded is kept (and compared against)
+            self.games = self._read()
+            state = self.games.get(key, {})
+            changed = {name: value for name, value in fields.items() if state.get(name) != value}
+            if not changed:
+                return
+            self.games[key] = {**state, **changed, "updated": round(time.time(), 3)}
+            self._write()
+
+    def forget(self, url):
+        """Drops the game's saved state."""
+        with self._locked():
+            self.games = self._read()
+            if self.games.pop(game_key(url), None) is not None:
+                self._write()
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".state-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"games": self.games}, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)  # Atomic: readers see the old file or the new one, never a mix
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,214 @@
+# supervisor.py
+# Spreads the headless runner over several Chrome instances (and CPU cores): one worker process per
+# debug endpoint, or per group of tabs within one endpoint. Workers report heartbeats and their final
+# per-game stats over a queue; the supervisor restarts workers that crash or stop reporting.
+#   python supervisor.py --endpoint http://127.0.0.1:9222 --endpoint http://127.0.0.1:9223 --config bot_config.json
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+
+import botlog
+import connection
+import fleet
+import main
+import recorder
+import state_store
+
+HEARTBEAT_INTERVAL = 10  # Seconds between worker heartbeats
+
+_log = botlog.get_logger("supervisor")
+
+
+# --- Worker process ---
+
+async def _send_heartbeats(worker_id, sessions, results):
+    while True:
+        results.put(("heartbeat", worker_id, [(s.name, dict(s.stats)) for s in sessions]))
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def _run_worker(worker_id, config, results):
+    link = connection.BrowserLink(config["browser_url"])
+    await link.open()
+    recording = recorder.Recorder(config["record"]) if config["record"] else None
+    # Shared by every worker (each saves only its own games), so a restarted worker resumes mid-game
+    state = state_store.StateStore(config["state_file"]) if config["state_file"] else None
+    try:
+        sessions = await main.build_sessions(link, config, recording, state)
+        if not sessions:
+            results.put(("done", worker_id, []))
+            return
+        heartbeat = asyncio.ensure_future(_send_heartbeats(worker_id, sessions, results))
+        try:
+            await fleet.Fleet(sessions).run()
+        finally:
+            heartbeat.cancel()
+        results.put(("done", worker_id, [(s.name, dict(s.stats)) for s in sessions]))
+    finally:
+        if recording:
+            recording.close()
+        await link.close()
+
+
+def _worker_main(worker_id, config, results):
+    """Entry point of a worker process. Any exception ends the process with a non-zero exit code."""
+    main.configure_logging(config)  # A spawned process starts without the parent's logging set up
+    _log.info("[worker %d] Connecting to %s (tabs: %s)", worker_id, config['browser_url'],
+              config.get('tab_shard') or 'all')
+    asyncio.run(_run_worker(worker_id, config, results))
+
+
+# --- Supervisor ---
+
+class Worker:
+    """Bookkeeping for one worker process: its config, its latest heartbeat and its restart count."""
+
+    def __init__(self, worker_id, config):
+        self.id = worker_id
+        self.config = config
+        self.process = None
+        self.restarts = 0
+        self.last_heartbeat = None
+        self.start_at = 0.0  # Earliest time the next (re)start may happen
+        self.sessions = []  # [(game name, stats)] as last reported
+        self.state = "pending"  # pending, running, done, failed
+
+
+class Supervisor:
+    """Starts one worker process per config, watches them and restarts the ones that die or hang."""
+
+    def __init__(self, configs, heartbeat_timeout=120, max_restarts=5):
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.workers = [Worker(i, config) for i, config in enumerate(configs)]
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_restarts = max_restarts
+
+    def _start(self, worker):
+        worker.process = self.context.Process(target=_worker_main, args=(worker.id, worker.config, self.results),
+                                              name=f"monsoonsim-worker-{worker.id}", daemon=True)
+        worker.process.start()
+        worker.last_heartbeat = time.monotonic()
+        worker.state = "running"
+
+    def _restart_later(self, worker, reason):
+        if worker.restarts >= self.max_restarts:
+            _log.error("[supervisor] Worker %d %s. Giving up after %d restarts.", worker.id, reason, worker.restarts)
+            worker.state = "failed"
+            return
+        delay = min(60, 2 ** worker.restarts)
+        worker.restarts += 1
+        worker.start_at = time.monotonic() + delay
+        worker.state = "pending"
+        _log.warning("[supervisor] Worker %d %s. Restarting in %ss (restart %d).", worker.id, reason, delay,
+                     worker.restarts)
+
+    def _handle(self, message):
+        kind, worker_id, sessions = message
+        worker = self.workers[worker_id]
+        worker.last_heartbeat = time.monotonic()
+        worker.sessions = sessions
+        if kind == "done":
+            worker.state = "done"
+
+    def _drain(self):
+        while True:
+            try:
+                self._handle(self.results.get_nowait())
+            except queue.Empty:
+                return
+
+    def _check(self, worker):
+        now = time.monotonic()
+        if worker.state == "pending" and now >= worker.start_at:
+            self._start(worker)
+        elif worker.state == "running" and not worker.process.is_alive():
+            self._drain()  # Its final "done" may have arrived after the last read
+            if worker.state == "running":
+                self._restart_later(worker, f"exited with code {worker.process.exitcode}")
+        elif worker.state == "running" and now - worker.last_heartbeat > self.heartbeat_timeout:
+            worker.process.terminate()
+            worker.process.join(5)
+            self._restart_later(worker, f"sent no heartbeat for {self.heartbeat_timeout}s")
+
+    def run(self):
+        """Blocks until every worker has finished or been given up on, then prints the combined report."""
+        _log.info("[supervisor] Starting %d worker(s)...", len(self.workers))
+        try:
+            while any(w.state in ("pending", "running") for w in self.workers):
+                try:
+                    self._handle(self.results.get(timeout=1))
+                except queue.Empty:
+                    pass
+                self._drain()
+                # Every round, however busy the queue is, so restarts and dead or hung workers aren't starved
+                for worker in self.workers:
+                    self._check(worker)
+        finally:
+            for worker in self.workers:
+                if worker.process is not None and worker.process.is_alive():
+                    worker.process.terminate()
+            print(self.report())
+
+    def report(self):
+        """A per-worker, per-game summary table, from each worker's last report."""
+        lines = [f"{'worker':<7} {'state':<8} {'restarts':>8}  {'game':<40} {'status':<9} {'days':>5} {'orders':>7} "
+                 f"{'service':>8}"]
+        for worker in self.workers:
+            for name, stats in worker.sessions or [("-", None)]:
+                if stats is None:
+                    lines.append(f"{worker.id:<7} {worker.state:<8} {worker.restarts:>8}  {name:<40}")
+                    continue
+                lines.append(f"{worker.id:<7} {worker.state:<8} {worker.restarts:>8}  {name[:40]:<40} "
+                             f"{stats['status']:<9} {stats['days']:>5} {stats['orders_placed']:>7} "
+                             f"{stats['service_handled']:>8}")
+        return "\n".join(lines)
+
+
+def worker_configs(config, endpoints, workers_per_endpoint=1):
+    """
+    One worker config per endpoint, or workers_per_endpoint configs per endpoint that each take every n-th
+    matching tab. With a "games" list, each worker drives its share of the games it finds on its endpoint.
+    """
+    configs = []
+    for endpoint in endpoints:
+        for shard in range(workers_per_endpoint):
+            worker = {**config, "browser_url": endpoint}
+            # One recording file and log file per worker process, e.g. session.w0.jsonl.gz
+            for key in ("record", "log_file"):
+                if config[key]:
+                    directory, filename = os.path.split(config[key])
+                    base, dot, extension = filename.partition(".")
+                    worker[key] = os.path.join(directory, f"{base}.w{len(configs)}{dot}{extension}")
+            if workers_per_endpoint > 1:
+                worker.update(fleet=True, tab_shard=[shard, workers_per_endpoint])
+            configs.append(worker)
+    return configs
+
+
+def build_parser():
+    parser = main.build_parser()
+    parser.description = "Run the automation loop across several Chrome instances, one worker process each."
+    parser.add_argument("--endpoint", action="append",
+                        help="Chrome remote debugging endpoint (repeatable; default: the config's browser_url)")
+    parser.add_argument("--workers-per-endpoint", type=int, default=1,
+                        help="Split each browser's matching tabs over this many worker processes")
+    parser.add_argument("--heartbeat-timeout", type=int, default=120,
+                        help="Restart a worker that sends no heartbeat for this many seconds")
+    parser.add_argument("--max-restarts", type=int, default=5, help="Give up on a worker after this many restarts")
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    config = main.load_config(args)
+    main.configure_logging(config)
+    endpoints = args.endpoint or config["endpoints"] or [config["browser_url"]]
+    supervisor = Supervisor(worker_configs(config, endpoints, args.workers_per_endpoint),
+                            heartbeat_timeout=args.heartbeat_timeout, max_restarts=args.max_restarts)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        _log.info("Interrupted.")
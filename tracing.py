@@ -0,0 +1,222 @@
+# tracing.py
+# Opt-in span instrumentation for game_api, written out as Chrome trace-event JSON
+# (open the files in chrome://tracing or https://ui.perfetto.dev). One file is written per game day, and per game
+# session when several games share a process (see use_session).
+# Enable it with tracing.enable("traces") or by setting MONSOONSIM_TRACE_DIR before starting the bot.
+# While disabled, span() hands back a shared no-op object and traced() wrappers call straight through.
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import weakref
+
+import botlog
+
+_log = botlog.get_logger("tracing")
+
+enabled = False
+_directory = None
+_origin = time.perf_counter()
+_pid = os.getpid()
+_task_lanes = weakref.WeakKeyDictionary()  # Dropped along with their tasks, so long runs don't keep every task
+_thread_lanes = {}
+_lane_numbers = itertools.count(1)
+
+
+class _Trace:
+    """The spans recorded for one game session (or for the whole process, outside of one) and the day they belong to."""
+
+    def __init__(self, session=None):
+        self.prefix = f"trace_{re.sub(r'[^A-Za-z0-9.-]+', '_', session).strip('_')[:80]}_" if session else "trace_"
+        self.day = None
+        self.events = []
+
+
+# The trace used outside of any game session (the GUI and the single-game runner)
+_DEFAULT_TRACE = _Trace()
+# The trace of the game session running in the current asyncio task, if any
+_ACTIVE_TRACE = contextvars.ContextVar("tracing_active_trace", default=None)
+_session_traces = {}
+
+
+def _active_trace():
+    return _ACTIVE_TRACE.get() or _DEFAULT_TRACE
+
+
+def enable(directory="traces"):
+    """Starts recording spans, writing one trace file per game day into directory."""
+    global enabled, _directory
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    enabled = True
+    _log.info("Tracing enabled. Writing Chrome trace files to: %s", os.path.abspath(directory))
+
+
+def disable():
+    """Writes out the spans recorded so far and stops recording."""
+    global enabled
+    _flush_all()
+    enabled = False
+
+
+@contextlib.contextmanager
+def use_session(session):
+    """
+    Records the spans of the block (and of tasks it starts) into the named session's own trace files, so games
+    sharing a process each get their own days. Entering the block again with the same name carries on that trace.
+    """
+    trace = _session_traces.get(session)
+    if trace is None:
+        trace = _session_traces[session] = _Trace(session)
+    token = _ACTIVE_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        _flush(trace)
+        _ACTIVE_TRACE.reset(token)
+
+
+def set_day(day):
+    """Starts a new trace file for the given game day, writing out the previous day's spans."""
+    trace = _active_trace()
+    if not enabled or day == trace.day:
+        return
+    _flush(trace)
+    trace.day = day
+
+
+def flush():
+    """Writes the current day's spans to its trace file (merging with any spans already written for that day)."""
+    _flush(_active_trace())
+
+
+def _flush_all():
+    for trace in [_DEFAULT_TRACE, *_session_traces.values()]:
+        _flush(trace)
+
+
+def _flush(trace):
+    if not trace.events or not _directory:
+        return
+    name = f"day_{trace.day:03d}" if trace.day is not None else "startup"
+    path = os.path.join(_directory, f"{trace.prefix}{name}.json")
+    events = trace.events
+    trace.events = []
+    try:
+        if os.path.exists(path):
+            with open(path) as f:
+                events = json.load(f)["traceEvents"] + events
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    except Exception as e:
+        _log.warning("Could not write trace file %s: %s", path, e)
+
+
+def _lane():
+    """A small, stable thread id per asyncio task, so concurrent coroutines get their own rows in the viewer."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    lanes, key = (_task_lanes, task) if task else (_thread_lanes, threading.get_ident())
+    lane = lanes.get(key)
+    if lane is None:
+        lane = lanes[key] = next(_lane_numbers)
+    return lane
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def set(self, **args):
+        """Adds or overrides arguments, e.g. span.set(outcome="rate_limited")."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if "outcome" not in self.args:
+            if exc_type is None:
+                self.args["outcome"] = "ok"
+            elif issubclass(exc_type, asyncio.CancelledError):
+                self.args["outcome"] = "cancelled"
+            else:
+                self.args["outcome"] = f"error: {exc}"
+        _active_trace().events.append({
+            "name": self.name, "cat": "game_api", "ph": "X", "pid": _pid, "tid": _lane(),
+            "ts": round((self.start - _origin) * 1e6, 1), "dur": round((end - self.start) * 1e6, 1), "args": self.args})
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name, **args):
+    """Context manager timing a block as one trace event. Usable around awaits."""
+    if not enabled:
+        return _NOOP_SPAN
+    return _Span(name, args)
+
+
+def traced(arg_names=("location_name", "selector"), context=None):
+    """
+    Decorator wrapping a coroutine function in a span named after it.
+    Arguments listed in arg_names are recorded on the span, plus whatever the context callable returns.
+    String results (the game_api status messages) are recorded as the span's result.
+    """
+    def decorator(fn):
+        positions = [(name, i) for i, name in enumerate(inspect.signature(fn).parameters) if name in arg_names]
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not enabled:
+                return await fn(*args, **kwargs)
+            span_args = dict(context()) if context else {}
+            for name, i in positions:
+                value = kwargs.get(name, args[i] if i < len(args) else None)
+                if value is not None:
+                    span_args[name] = value
+            with _Span(fn.__name__, span_args) as s:
+                result = await fn(*args, **kwargs)
+                if isinstance(result, str):
+                    s.set(result=result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+atexit.register(_flush_all)
+
+if os.environ.get("MONSOONSIM_TRACE_DIR"):
+    enable(os.environ["MONSOONSIM_TRACE_DIR"])